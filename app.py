@@ -1,96 +1,290 @@
-import pandas as pd
-from flask import Flask, request, session
-from gameLogic import Noun, pick_random_noun, check_article,EXCEL_FILE,xl
+from flask import Flask, Response, g, make_response, render_template, request, session, url_for
+from markupsafe import Markup, escape
+from gameLogic import (
+    Deck, UnitSampler, pick_random_noun, check_article, load_nouns, load_plural_answers,
+    load_unit_mix, load_vocabulary_index,
+)
+import vocab
+import sessions
+import leaderboard
+import history
+import events
+import race
+import ratelimit
+import scheduler
+import migrations
+import metrics
+import importer
 import psycopg2
+from psycopg2.extras import execute_values
+import click
+import gzip
+import hashlib
+import math
 import os
+import secrets
 import time
-from datetime import datetime
-from database import get_connection
+from datetime import datetime, timezone
+from database import connection
+from writebehind import BatchWriter
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
 
 DB_FILE = "scores.db"
 
-def game_type_html(game_type):
-    if game_type == "plural":
-        return """
-        <form method="post">
-            <input type="text" name="plural"
-                   placeholder="Plural eingeben"
-                   style="font-size:1.5em; padding:12px; border-radius:10px;
-                          border:none; text-align:center;">
-            <br><br>
-            <button type="submit"
-                    style="font-size:1.5em; padding:12px 30px;
-                           border-radius:10px; border:none;
-                           background-color:#f1c40f;">
-                Prüfen
-            </button>
-        </form>
-        """
+app = Flask("DeutschA1.1", root_path=os.path.dirname(os.path.abspath(__file__)))
+app.secret_key = os.environ.get("SECRET_KEY", "dev-key")
+
+# Static assets are referenced by content hash, so browsers may cache them forever
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+_asset_hashes = {}
+
+
+def asset_url(filename):
+    """URL of a static file, versioned by a hash of its contents."""
+    digest = _asset_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(app.static_folder, filename), "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        _asset_hashes[filename] = digest
+    return url_for("static", filename=filename, v=digest)
+
+
+@app.after_request
+def cache_static_assets(response):
+    if request.endpoint == "static":
+        filename = request.view_args.get("filename")
+        if request.args.get("v") and request.args.get("v") == _asset_hashes.get(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+    return response
+
+
+# Dynamic responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 512
+COMPRESS_MIMETYPES = {"text/html", "application/json", "text/plain", "text/css", "application/javascript"}
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+
+@app.after_request
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough  # files sent by send_file
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESS_MIMETYPES
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        data, coding = brotli.compress(data, quality=BROTLI_QUALITY), "br"
+    elif accepted["gzip"]:
+        data, coding = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+    else:
+        return response
+    response.set_data(data)
+    response.headers["Content-Encoding"] = coding
+    return response
+
+
+def page_validators(*parts, last_modified=None):
+    """Weak ETag over ``parts``, plus a 304 response if the client's copy is current.
+
+    Returns (etag, last_modified, not_modified); not_modified is None when
+    the page has to be rendered.
+    """
+    etag = hashlib.sha256(repr(parts).encode()).hexdigest()[:20]
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
     else:
-        return """
-        <form method="post">
-            <button class="article" name="article" value="der">der</button>
-            <button class="article" name="article" value="die">die</button>
-            <button class="article" name="article" value="das">das</button>
-        </form>
-        """
-
-
-def normalise(text: str) -> str:
-    return "".join(text.lower().split())
-
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS scores (
-            id SERIAL PRIMARY KEY,
-            player_name TEXT NOT NULL,
-            points INTEGER NOT NULL,
-            guesses INTEGER NOT NULL,
-            accuracy REAL NOT NULL,
-            final_time REAL DEFAULT 0,
-            sheet_name TEXT,
-            timestamp TEXT NOT NULL
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified <= request.if_modified_since)
+    not_modified = None
+    if fresh:
+        not_modified = Response(status=304)
+        set_validators(not_modified, etag, last_modified)
+    return etag, last_modified, not_modified
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Cacheable, but always revalidated; the pages greet the player by name
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    response.vary.add("Cookie")
+    return response
+
+
+def as_datetime(value):
+    """Score timestamps come as datetimes or ISO strings; naive ones are server-local."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.astimezone()
+
+
+def format_timestamp(value):
+    return as_datetime(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+app.jinja_env.globals["asset_url"] = asset_url
+app.jinja_env.filters["timestamp"] = format_timestamp
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+# Compile every template and hash every asset once, not on first request
+with app.test_request_context():
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+    for filename in os.listdir(app.static_folder):
+        asset_url(filename)
+app.session_interface = sessions.ServerSideSessionInterface(sessions.store_from_env())
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    start = g.get("request_start")
+    if start is not None:
+        metrics.request_seconds.observe(
+            time.perf_counter() - start,
+            request.method, request.endpoint or "unmatched", str(response.status_code),
         )
-    """)
-    conn.commit()
-    conn.close()
-
-GENDER_MAP = {
-    "der": "masculine",
-    "die": "feminine",
-    "das": "neuter"
-}
-
-
-def load_nouns(sheet_name: str, ):
-    if sheet_name is None:
-        sheet_name = xl.sheet_names[0]
-    df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
-    nouns = []
-    for _, row in df.iterrows():
-        nouns.append(Noun(
-            word=row["Nomen"],
-            article=row["Artikel"],
-            gender=GENDER_MAP.get(row["Artikel"].lower()),
-            plural=str(row["Plural"]),
-            meaning=str(row["Übersetzung"])
-        ))
-    return nouns
-
-
-# Call it once on startup
-init_db()
-
-app = Flask("DeutschA1.1")
-app.secret_key = os.environ.get("SECRET_KEY", "dev-key")
+    return response
+
+
+@metrics.REGISTRY.collector
+def session_metrics():
+    return [("sessions_stored", "gauge", "Live sessions in the session store.",
+             {(): len(app.session_interface.store)})]
+
 
-sheet_name = "Unit 4"
-# TEMPORARY
-nouns = load_nouns(sheet_name)
+# Guesses per second a player may submit, in bursts of up to GUESS_BURST
+GUESS_RATE = float(os.environ.get("GUESS_RATE", 5))
+GUESS_BURST = int(os.environ.get("GUESS_BURST", 10))
+# Requests one process works on at once, and how long a request may wait
+# for a slot before it is turned away
+MAX_INFLIGHT = int(os.environ.get("MAX_INFLIGHT", 64))
+ADMISSION_WAIT = float(os.environ.get("ADMISSION_WAIT", 0.05))
+GUESS_ENDPOINTS = {"home", "api_guess"}
+# Monitoring and static files are served even when the game is saturated
+ADMISSION_EXEMPT = {"static", "metrics_endpoint"}
 
-current_noun = pick_random_noun(nouns)
+guess_limiter = ratelimit.RateLimiter("guess", ratelimit.store_from_env(), GUESS_RATE, GUESS_BURST)
+admission = ratelimit.Admission(MAX_INFLIGHT, ADMISSION_WAIT)
+
+# Served without a template, session write or database call
+TOO_MANY_REQUESTS_PAGE = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Zu viele Anfragen</title></head>'
+    '<body><h1>Zu viele Anfragen</h1><p>Bitte kurz warten und dann '
+    '<a href="/">weiterspielen</a>.</p></body></html>'
+)
+
+
+def too_many_requests(retry_after):
+    if request.path.startswith("/api/"):
+        response = make_response({"error": "too many requests", "retry_after": round(retry_after, 3)}, 429)
+    else:
+        response = Response(TOO_MANY_REQUESTS_PAGE, 429, mimetype="text/html")
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@app.before_request
+def admit_request():
+    if request.endpoint in ADMISSION_EXEMPT:
+        return None
+    if not admission.enter():
+        return too_many_requests(1)
+    g.admitted = True
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop("admitted", False):
+        admission.leave()
+
+
+@app.before_request
+def limit_guesses():
+    """Refuse guesses beyond the player's rate before the game is even loaded."""
+    if request.method != "POST" or request.endpoint not in GUESS_ENDPOINTS:
+        return None
+    name = session.get("player_name")
+    wait = guess_limiter.check(f"player:{name}" if name else f"session:{session.sid}")
+    return too_many_requests(wait) if wait else None
+
+
+@metrics.REGISTRY.collector
+def admission_metrics():
+    return [
+        ("requests_inflight", "gauge", "Requests being worked on by this process.",
+         {(): admission.inflight}),
+        ("ratelimit_buckets", "gauge", "Token buckets held by the rate limiter.",
+         {(): len(guess_limiter.store)}),
+    ]
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending database schema migrations."""
+    applied = migrations.migrate()
+    print("\n".join(applied) if applied else "Schema is up to date.")
+
+
+@app.cli.command("build-vocab")
+def build_vocab_command():
+    """Compile the vocabulary source into the shared store before workers start."""
+    vocabulary = vocab.load()
+    print(f"{vocab.CACHE_FILE}: version {vocabulary.version}, "
+          f"{sum(len(rows) for rows in vocabulary.sheets.values())} nouns")
+
+
+@app.cli.command("import-vocab")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--prune", is_flag=True, help="Delete nouns a sheet no longer contains.")
+@click.option("--dry-run", is_flag=True, help="Validate and report without saving.")
+def import_vocab_command(paths, prune, dry_run):
+    """Import workbooks or CSV files into the vocabulary tables."""
+    rejected = 0
+    for path in paths:
+        reports, errors = importer.import_file(path, prune=prune, dry_run=dry_run)
+        for error in errors:
+            print(f"  error: {error}")
+        for r in reports:
+            print(f"{path} [{r.name}]: {r.inserted} new, {r.updated} updated, "
+                  f"{r.unchanged} unchanged, {r.removed} removed, {len(r.errors)} rejected")
+            for line, error in r.errors:
+                print(f"  row {line}: {error}")
+        rejected += len(errors) + sum(len(r.errors) for r in reports)
+    if dry_run:
+        print("Dry run, nothing was saved.")
+    if rejected:
+        raise SystemExit(1)
 
 
 @app.route("/set_name", methods=["GET", "POST"])
@@ -109,49 +303,7 @@ def set_name():
     else:
         feedback = ""
 
-    return f"""
-    <html>
-    <head>
-        <title>Deutsch A1.1 - Name eingeben</title>
-        <style>
-            body {{
-                background-color: #121212;
-                color: #ffffff;
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                text-align: center;
-                padding: 50px;
-            }}
-            input {{
-                font-size: 1.5em;
-                padding: 10px;
-                border-radius: 5px;
-                border: none;
-            }}
-            button {{
-                font-size: 1.5em;
-                padding: 10px 20px;
-                border-radius: 10px;
-                margin-top: 20px;
-                cursor: pointer;
-                background-color: #3498db;
-                color: white;
-                border: none;
-            }}
-            button:hover {{ transform: scale(1.05); }}
-            .feedback {{ color: #e74c3c; margin-top: 20px; }}
-        </style>
-    </head>
-    <body>
-        <h1>Willkommen! Wie heißt du?</h1>
-        <form method="post">
-            <input type="text" name="name" placeholder="Dein Name">
-            <br>
-            <button type="submit">Start!</button>
-        </form>
-        <p class="feedback">{feedback}</p>
-    </body>
-    </html>
-    """
+    return render_template("set_name.html", feedback=feedback)
 
 
 @app.route("/select_game", methods=["GET", "POST"])
@@ -162,57 +314,54 @@ def select_game():
             session["game_type"] = game_type
             return "", 302, {"Location": "/select_sheet"}
 
-    return """
-    <html>
-    <head>
-        <title>Was möchtest du üben?</title>
-        <style>
-            body {
-                background-color: #121212;
-                color: white;
-                font-family: 'Segoe UI', sans-serif;
-                text-align: center;
-                padding: 50px;
-            }
-            h1 {
-                font-size: 2.5em;
-                margin-bottom: 40px;
-            }
-            button {
-                font-size: 2em;
-                padding: 25px 50px;
-                margin: 20px;
-                border-radius: 20px;
-                border: none;
-                cursor: pointer;
-                transition: transform 0.15s;
-            }
-            button:hover {
-                transform: scale(1.08);
-            }
-            .gender {
-                background: linear-gradient(135deg, #3498db, #9b59b6);
-                color: white;
-            }
-            .plural {
-                background: linear-gradient(135deg, #2ecc71, #f1c40f);
-                color: black;
-            }
-        </style>
-    </head>
-    <body>
-        <h1>Was möchtest du üben?</h1>
-        <form method="post">
-            <button class="gender" name="game_type" value="gender">
-                🧠 Artikel
-            </button>
-            <button class="plural" name="game_type" value="plural">
-                🔁 Plural
-            </button>
-        </form>
-    </body>
-    </html>
-    """
+    return render_template("select_game.html")
+
+
+def insert_scores(records):
+    """Insert score records with one multi-row INSERT and update best_scores."""
+    with connection("insert_scores") as conn:
+        c = conn.cursor()
+        ids = execute_values(c, """
+            INSERT INTO scores (player_name, points, guesses, accuracy, final_time, sheet_name, timestamp)
+            VALUES %s
+            RETURNING id
+        """, [
+            (r["player_name"], r["points"], r["guesses"], r["accuracy"],
+             r["final_time"], r["sheet_name"], r["timestamp"])
+            for r in records
+        ], fetch=True)
+
+        # One row per (sheet, player): ON CONFLICT can't touch a row twice
+        best = {}
+        for r, (score_id,) in zip(records, ids):
+            key = (r["sheet_name"], r["player_name"])
+            previous = best.get(key)
+            if previous is None or (r["accuracy"], -r["final_time"]) > (previous[2], -previous[3]):
+                best[key] = (r["sheet_name"], r["player_name"], r["accuracy"], r["final_time"], score_id)
+        execute_values(c, """
+            INSERT INTO best_scores (sheet_name, player_name, accuracy, final_time, score_id)
+            VALUES %s
+            ON CONFLICT (sheet_name, player_name) DO UPDATE
+            SET accuracy = EXCLUDED.accuracy,
+                final_time = EXCLUDED.final_time,
+                score_id = EXCLUDED.score_id
+            WHERE EXCLUDED.accuracy > best_scores.accuracy
+               OR (EXCLUDED.accuracy = best_scores.accuracy
+                   AND EXCLUDED.final_time < best_scores.final_time)
+        """, list(best.values()))
+
+
+# Optional write-behind: finished challenges are queued and inserted in batches
+score_writer = None
+if os.environ.get("SCORE_WRITE_BEHIND") == "1":
+    score_writer = BatchWriter(
+        "scores",
+        insert_scores,
+        batch_size=int(os.environ.get("SCORE_FLUSH_SIZE", 50)),
+        interval=float(os.environ.get("SCORE_FLUSH_INTERVAL", 1.0)),
+        max_pending=int(os.environ.get("SCORE_QUEUE_MAX", 10_000)),
+        spill_dir=os.environ.get("SCORE_SPILL_DIR", ".score_spill"),
+    )
 
 
 def save_score():
@@ -223,264 +372,277 @@ def save_score():
     guesses = session.get("guesses", 0)
     accuracy = round((points / guesses) * 100, 1) if guesses > 0 else 0
     final_time = session.get("final_time", 0)  # will be 0 if free practice
-    timestamp = datetime.now().isoformat()
+    timestamp = datetime.now(timezone.utc).isoformat()
 
     if not player_name:
         return  # nothing to save
+    metrics.challenges_total.inc(session.get("game_type", "gender"))
+
+    record = {
+        "player_name": player_name,
+        "points": points,
+        "guesses": guesses,
+        "accuracy": accuracy,
+        "final_time": final_time,
+        "sheet_name": sheet_name,
+        "timestamp": timestamp,
+    }
+    if score_writer is None or not score_writer.submit(record):
+        insert_scores([record])
+    leaderboard.record_score(player_name, sheet_name, points, guesses, accuracy, final_time, timestamp)
+
+
+def game_vocabulary():
+    """The vocabulary snapshot the current game was started on.
+
+    If that version has been dropped since, the game moves to the current
+    vocabulary and its noun indices are reset.
+    """
+    vocabulary = vocab.snapshot(session.get("vocab_version"))
+    if vocabulary is None:
+        vocabulary = vocab.get_vocabulary()
+        session["vocab_version"] = vocabulary.version
+        session.pop("deck", None)
+        session.pop("current_noun", None)
+        session.pop("units", None)  # sheet ids are positions in the old version
+    return vocabulary
+
+def start_game(mode):
+    """Start a practice, challenge or mix round on the sheets chosen in the session."""
+    session["mode"] = mode
+    if mode == "mix":
+        sampler = UnitSampler(*load_unit_mix(session["units"], game_vocabulary()))
+        session["current_noun"] = sampler.next()
+        session["mix"] = sampler.state()
+        session["shown_at"] = time.time()
+        return
+    noun_count = len(load_nouns(session["sheet_name"], game_vocabulary()))
+    session.pop("deck", None)
+    session.pop("finished", None)
+    if mode == "challenge":
+        session["start_time"] = time.time()
+        deck = Deck(noun_count)
+        session["current_noun"] = deck.draw()
+        session["deck"] = deck.state()
+    else:
+        reviews = scheduler.get_queue(
+            session["player_name"], session["sheet_name"], session["game_type"], noun_count
+        )
+        session["current_noun"] = reviews.next()
+    session["shown_at"] = time.time()
 
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO scores (player_name, points, guesses, accuracy, final_time, sheet_name, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """, (player_name, points, guesses, accuracy, final_time, sheet_name, timestamp))
-    conn.commit()
-    conn.close()
 
 @app.route("/select_mode", methods=["GET", "POST"])
 def select_mode():
     if request.method == "POST":
         mode = request.form.get("mode")
         if mode in ["practice", "challenge"]:
-            session["mode"] = mode
-            session["remaining_nouns"] = session["nouns"].copy()
-            session["current_noun"] = pick_random_noun(session["remaining_nouns"])
-
-            if mode == "challenge":
-                session["start_time"] = time.time()
-                session["remaining_nouns"] = session["nouns"].copy()
-                session["current_noun"] = pick_random_noun(session["remaining_nouns"])
+            start_game(mode)
             return "", 302, {"Location": "/"}
 
-    return f"""
-    <html>
-    <head>
-        <title>Modus wählen</title>
-        <style>
-            body {{
-                background-color: #121212;
-                color: white;
-                font-family: 'Segoe UI', sans-serif;
-                text-align: center;
-                padding: 50px;
-            }}
-            button {{
-                font-size: 2em;
-                padding: 20px 40px;
-                margin: 20px;
-                border-radius: 15px;
-                border: none;
-                cursor: pointer;
-            }}
-            .practice {{ background-color: #2ecc71; }}
-            .challenge {{ background-color: #e74c3c; }}
-        </style>
-    </head>
-    <body>
-        <h1>Wie möchtest du üben?</h1>
-        <form method="post">
-            <button class="practice" name="mode" value="practice">
-                Freies Üben
-            </button>
-            <button class="challenge" name="mode" value="challenge">
-                Herausforderung
-            </button>
-        </form>
-    </body>
-    </html>
+    return render_template("select_mode.html")
+
+
+REQUIRED_SESSION_KEYS = [
+    "player_name",
+    "game_type",
+    "sheet_name",
+    "mode",
+]
+
+
+def has_game(vocabulary):
+    """Whether every sheet the session's game is played on is in ``vocabulary``.
+
+    A race can only be played while its room is running, and a finished
+    challenge or race is over until the next one starts.
     """
+    if session.get("finished"):
+        return False
+    if session["mode"] == "mix":
+        return "units" in session
+    if session["mode"] == "race":
+        room = race.get(session.get("race"))
+        if room is None or room.status != "running":
+            return False
+    return session["sheet_name"] in vocabulary.sheets
 
 
-@app.route("/", methods=["GET", "POST"])
-def home():
-    game_type = session.get("game_type", "gender")
-    mode = session.get("mode", "practice")
-    player_name = session.get("player_name")
-    REQUIRED_SESSION_KEYS = [
-        "player_name",
-        "game_type",
-        "sheet_name",
-        "nouns",
-        "mode",
-    ]
+def no_game_url():
+    if session.get("finished"):
+        return finished_url()
+    if session["mode"] == "race":
+        return f"/race/{session.get('race', '')}"
+    return "/select_sheet"
 
-    for key in REQUIRED_SESSION_KEYS:
-        if key not in session:
-            session.clear()
-            return "", 302, {"Location": "/set_name"}
 
-    if "remaining_nouns" not in session:
-        session["remaining_nouns"] = session["nouns"].copy()
+def finished_url():
+    return f"/race/{session['race']}" if session["mode"] == "race" else "/challenge_result"
+
+
+def open_game(vocabulary):
+    """Load the session's game: its nouns, plus the deck (challenge) or review queue (practice).
+
+    A mix game's nouns are the whole vocabulary index and its UnitSampler
+    takes the review queue's place; it has the same next() and upcoming().
+    """
+    # Challenge mode walks a shuffled deck; practice follows the review schedule
+    deck = reviews = None
+    if session["mode"] == "mix":
+        nouns = load_vocabulary_index(vocabulary)
+        reviews = UnitSampler.from_state(load_unit_mix(session["units"], vocabulary), session["mix"])
+    elif session["mode"] in ("challenge", "race"):
+        nouns = load_nouns(session["sheet_name"], vocabulary)
+        if "deck" not in session:
+            session["deck"] = Deck(len(nouns)).state()
+        deck = Deck.from_state(len(nouns), session["deck"])
+        if session["mode"] == "race" and "start_time" not in session:
+            session["start_time"] = race.get(session["race"]).start_time  # the room's clock
+    else:
+        nouns = load_nouns(session["sheet_name"], vocabulary)
+        reviews = scheduler.get_queue(
+            session["player_name"], session["sheet_name"], session["game_type"], len(nouns)
+        )
 
     if "current_noun" not in session:
-        session["current_noun"] = pick_random_noun(session["remaining_nouns"])
+        session["current_noun"] = deck.draw() if deck else reviews.next()
+        session["shown_at"] = time.time()
 
     # Initialize session values (first visit)
     if "points" not in session:
         session["points"] = 0
         session["guesses"] = 0
+    return nouns, deck, reviews
 
-    if "current_noun" not in session:
-        if mode == "challenge":
-            session["current_noun"] = pick_random_noun(session["remaining_nouns"])
-        else:
-            session["current_noun"] = pick_random_noun(session["nouns"])
 
-    current_noun = Noun(**session["current_noun"])
-    title_text = (
-        f"Was ist der Plural, {player_name}?"
-        if game_type == "plural"
-        else f"Welcher Artikel, {player_name}?"
-    )
-    feedback = ""
+def grade_guess(nouns, deck, reviews, guess):
+    """Grade a guess for the current noun and move on to the next one.
 
-    # Words left (for challenge mode)
-    words_left_text = ""
-    if mode == "challenge":
-        words_left_text = f"Wörter übrig: {len(session['remaining_nouns'])}"
+    Returns (correct, feedback, finished); a finished challenge has
+    already been saved.
+    """
+    game_type = session["game_type"]
+    mode = session["mode"]
+    current_noun = nouns[session["current_noun"]]
+    # The noun's own sheet and index there; they differ from the session's in a mix
+    if mode == "mix":
+        sheet_name, noun_index = nouns.locate(session["current_noun"])
+    else:
+        sheet_name, noun_index = session["sheet_name"], session["current_noun"]
+    session["guesses"] += 1
 
-    # Handle POST (guess submission)
-    if request.method == "POST":
-        session["guesses"] += 1
+    if game_type == "plural":
+        answers = load_plural_answers(sheet_name, game_vocabulary())[noun_index]
+        match = answers.match(guess)
+
+        correct = match is not None
+        metrics.guesses_total.inc(game_type, mode, "correct" if correct else "wrong")
+
+        if match == "typo":
+            session["points"] += 1
+            feedback = Markup("✅ Fast richtig! Geschrieben wird es: <strong>{}</strong>").format(answers.display)
+        elif correct:
+            session["points"] += 1
+            feedback = Markup("✅ Richtig! Die Antwort ist: <strong>{}</strong>").format(answers.display)
+        else:
+            feedback = Markup("❌ Falsch. Richtig ist: <strong>{}</strong>").format(answers.display)
 
-        if game_type == "plural":
-            guess = request.form.get("plural", "")
-            user_answer = normalise(guess)
-            correct_answer = normalise(current_noun.plural)
+        if deck:
+            deck.mark_done(session["current_noun"])
+        elif mode == "practice":
+            scheduler.record_answer(reviews, session["current_noun"], correct)
+
+    else:
+        correct = check_article(current_noun, guess)
+        metrics.guesses_total.inc(game_type, mode, "correct" if correct else "wrong")
+
+        if correct:
+            session["points"] += 1
+            feedback = f"✅ Richtig! {current_noun.article} {current_noun.word}"
+            if deck:
+                deck.mark_done(session["current_noun"])
+        else:
+            feedback = f"❌ Falsch. Richtig ist: {current_noun.article} {current_noun.word}"
+            if deck:
+                deck.requeue(session["current_noun"])
+        if mode == "practice":
+            scheduler.record_answer(reviews, session["current_noun"], correct)
+
+    # Answer time is measured from when the noun was handed out
+    now = time.time()
+    events.record_guess(
+        session["player_name"], sheet_name, game_type,
+        noun_index, current_noun.word, correct, now - session.get("shown_at", now),
+    )
 
-            correct = user_answer == correct_answer
+    if deck and not deck.words_left():
+        # Challenge finished — save score
+        session["final_time"] = round(time.time() - session["start_time"], 1)
+        # Closed before saving, so a repeated guess cannot finish it again
+        session["deck"] = deck.state()
+        session.pop("current_noun", None)
+        session["finished"] = True
+        save_score()  # <-- save here only
+        if mode == "race":
+            race_progress(deck, session["final_time"])
+        return correct, feedback, True
+    if mode == "race":
+        race_progress(deck)
+
+    session["current_noun"] = deck.draw() if deck else reviews.next(exclude=session["current_noun"])
+    session["shown_at"] = now
+    if deck:
+        session["deck"] = deck.state()
+    elif mode == "mix":
+        session["mix"] = reviews.state()
+    return correct, feedback, False
 
-            if correct:
-                session["points"] += 1
-                feedback = f"✅ Richtig! Die Antwort ist: <strong>{current_noun.plural}</strong>"
-            else:
-                feedback = f"❌ Falsch. Richtig ist: <strong>{current_noun.plural}</strong>"
 
-            if mode == "challenge":
-                session["remaining_nouns"].remove(session["current_noun"])
+@app.route("/", methods=["GET", "POST"])
+def home():
+    game_type = session.get("game_type", "gender")
+    mode = session.get("mode", "practice")
+    player_name = session.get("player_name")
 
-            if mode == "challenge" and not session["remaining_nouns"]:
-                session["final_time"] = round(time.time() - session["start_time"], 1)
-                save_score()
-                return "", 302, {"Location": "/challenge_result"}
+    for key in REQUIRED_SESSION_KEYS:
+        if key not in session:
+            session.clear()
+            return "", 302, {"Location": "/set_name"}
 
-            session["current_noun"] = pick_random_noun(session["remaining_nouns"])
-            current_noun = Noun(**session["current_noun"])
+    vocabulary = game_vocabulary()
+    if not has_game(vocabulary):
+        return "", 302, {"Location": no_game_url()}  # sheet removed, or race not running
+    nouns, deck, reviews = open_game(vocabulary)
 
-        else:
-            guess = request.form.get("article", "")
-            correct = check_article(current_noun, guess)
-
-            if correct:
-                session["points"] += 1
-                feedback = f"✅ Richtig! {current_noun.article} {current_noun.word}"
-                if mode == "challenge":
-                    session["remaining_nouns"].remove(session["current_noun"])
-            else:
-                feedback = f"❌ Falsch. Richtig ist: {current_noun.article} {current_noun.word}"
-                if mode == "challenge":
-                    if session["current_noun"] not in session["remaining_nouns"]:
-                        session["remaining_nouns"].append(session["current_noun"])
-            # Next noun
-            if mode == "challenge" and not session["remaining_nouns"]:
-                    # Challenge finished — save score
-                    session["final_time"] = round(time.time() - session["start_time"], 1)
-                    save_score()  # <-- save here only
-                    return "", 302, {"Location": "/challenge_result"}
-            else:
-                session["current_noun"] = pick_random_noun(session["remaining_nouns"])
-
-            current_noun = Noun(**session["current_noun"])
+    title_text = (
+        f"Was ist der Plural, {player_name}?"
+        if game_type == "plural"
+        else f"Welcher Artikel, {player_name}?"
+    )
+    feedback = ""
 
+    # Handle POST (guess submission)
+    if request.method == "POST":
+        guess = request.form.get("plural" if game_type == "plural" else "article", "")
+        _, feedback, finished = grade_guess(nouns, deck, reviews, guess)
+        if finished:
+            return "", 302, {"Location": finished_url()}
+    current_noun = nouns[session["current_noun"]]
     accuracy = (
         round((session["points"] / session["guesses"]) * 100, 1)
         if session["guesses"] > 0 else 0
     )
-    # Timer JS for challenge mode
-    timer_script = ""
-    if mode == "challenge":
-        timer_script = f"""
-        <div id="timer" style="position:fixed; top:20px; left:20px; font-size:1.5em; color:white;">
-            ⏱️ 00:00:00
-        </div>
-        <script>
-            const startTime = """ + str(session['start_time']) + """;
-        
-            function updateTimer() {
-                let elapsed = Math.floor(Date.now()/1000 - startTime);
-                let hours = Math.floor(elapsed / 3600).toString().padStart(2,'0');
-                let minutes = Math.floor((elapsed % 3600)/60).toString().padStart(2,'0');
-                let seconds = (elapsed % 60).toString().padStart(2,'0');
-                document.getElementById('timer').textContent = `⏱️ ${hours}:${minutes}:${seconds}`;
-            }
-        
-            setInterval(updateTimer, 1000);
-            updateTimer();
-        </script>
-        """
-
-    # CSS
-    style = """
-        <style>
-            body {
-                background-color: #121212;
-                color: #ffffff;
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                text-align: center;
-                padding: 50px;
-            }
-            h1 { font-size: 2.5em; margin-bottom: 20px; }
-            button.article {
-                font-size: 1.5em;
-                margin: 10px;
-                padding: 15px 30px;
-                border-radius: 10px;
-                border: none;
-                cursor: pointer;
-                transition: transform 0.1s;
-            }
-            .noun-word {
-                font-size: 3.2em;
-                font-weight: 800;
-                margin: 30px 0;
-                color: #f1c40f;
-                text-shadow:
-                    0 0 10px rgba(241, 196, 15, 0.6),
-                    0 0 25px rgba(241, 196, 15, 0.4);
-            }
-            button.article:hover { transform: scale(1.1); }
-            button.article[value="der"] { background-color: #3498db; color: white; }
-            button.article[value="die"] { background-color: #e74c3c; color: white; }
-            button.article[value="das"] { background-color: #2ecc71; color: white; }
-            .feedback { font-size: 1.3em; margin: 20px 0; }
-            .score { margin-top: 30px; font-size: 1.2em; }
-            .restart {
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                font-size: 2em;
-                color: #ffffff;
-                text-decoration: none;
-            }
-            .restart:hover { color: #e74c3c; }
-        </style>
-        """
-
-    # Full HTML
-    return f"""
-        <html>
-        <head>
-            <title>German Articles Game</title>
-            {style}
-        </head>
-        <body>
-            {timer_script}
-            <a href="/reset" class="restart">✖</a>
-            <h1>{title_text}</h1>
-            <p class="noun-word">{current_noun.word}</p>
-            {game_type_html(game_type)}
-            <p class="feedback">{feedback}</p>
-        """
+    return render_template(
+        "game.html",
+        mode=mode,
+        game_type=game_type,
+        start_time=session.get("start_time"),
+        title_text=title_text,
+        noun=current_noun,
+        noun_index=session["current_noun"],
+        feedback=feedback,
+        race=session.get("race") if mode == "race" else None,
+    )
 
 
 @app.route("/challenge_result")
@@ -494,29 +656,11 @@ def challenge_result():
         time_message = f"{int(time_taken)} Sekunden"
     name = session.get("player_name", "")
     unit = session.get("sheet_name", "")
+    rank = leaderboard.player_rank(unit, name) if name and unit else None
 
-    return f"""
-    <html>
-    <head>
-        <title>Ergebnis</title>
-        <style>
-            body {{
-                background-color: #121212;
-                color: white;
-                font-family: 'Segoe UI', sans-serif;
-                text-align: center;
-                padding: 50px;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>🎉 Geschafft, {name}!</h1>
-        <h2>Unit: <strong>{unit}</strong>
-        <p style="font-size:2em;">Zeit: <strong>{time_message}</strong></p>
-        <a href="/full_reset" style="color:#3498db;">Nochmal spielen</a>
-    </body>
-    </html>
-    """
+    return render_template(
+        "challenge_result.html", name=name, unit=unit, time_message=time_message, rank=rank
+    )
 
 
 @app.route("/reset")
@@ -538,223 +682,429 @@ def full_reset():
 
 @app.route("/scores")
 def scores():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT player_name, points, guesses, accuracy, timestamp FROM scores ORDER BY accuracy DESC LIMIT 10")
-    rows = c.fetchall()
-    conn.close()
-
-    rows_html = "".join(
-        f"<tr><td>{r[0]}</td><td>{r[1]}</td><td>{r[2]}</td><td>{r[3]}%</td><td>{r[4][:19]}</td></tr>"
-        for r in rows
+    latest = leaderboard.latest_score()
+    etag, last_modified, not_modified = page_validators(
+        "scores", latest, last_modified=as_datetime(latest[1]) if latest else None
+    )
+    if not_modified:
+        return not_modified
+    rows = leaderboard.top_scores()
+
+    return set_validators(make_response(render_template("scores.html", rows=rows)), etag, last_modified)
+
+
+@app.route("/history")
+def score_history():
+    rows, older, newer = history.fetch_page(
+        before=request.args.get("before"), after=request.args.get("after")
+    )
+    return render_template("history.html", player=None, rows=rows, older=older, newer=newer)
+
+
+@app.route("/history/<path:player_name>")
+def player_history(player_name):
+    rows, older, newer = history.fetch_page(
+        player_name, before=request.args.get("before"), after=request.args.get("after")
+    )
+    return render_template(
+        "history.html",
+        player=player_name,
+        bests=history.player_bests(player_name),
+        rows=rows,
+        older=older,
+        newer=newer,
     )
 
-    return f"""
-    <html>
-    <head>
-        <title>High Scores</title>
-        <style>
-            body {{
-                background-color: #121212;
-                color: #ffffff;
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                text-align: center;
-                padding: 50px;
-            }}
-            table {{
-                margin: auto;
-                border-collapse: collapse;
-                width: 80%;
-            }}
-            th, td {{
-                border: 1px solid #ffffff;
-                padding: 10px;
-            }}
-            th {{
-                background-color: #3498db;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Top Scores</h1>
-        <table>
-            <tr><th>Name</th><th>Punkte</th><th>Versuche</th><th>Genauigkeit</th><th>Datum</th></tr>
-            {rows_html}
-        </table>
-        <p><a href="/">Zurück zum Spiel</a></p>
-    </body>
-    </html>
-    """
+
+def choose_sheet(vocabulary, sheet_name):
+    session["sheet_name"] = sheet_name
+    session.pop("units", None)
+    # Game state only holds indices into this version of the vocabulary
+    session["vocab_version"] = vocabulary.version
+    noun_count = len(load_nouns(sheet_name, vocabulary))
+    # Initialize first noun
+    session["current_noun"] = pick_random_noun(range(noun_count))
+    # Reset score and guesses
+    session["points"] = 0
+    session["guesses"] = 0
+
+
+# Sheets listed per page of the sheet picker
+SHEETS_PER_PAGE = int(os.environ.get("SHEETS_PER_PAGE", 20))
 
 
 @app.route("/select_sheet", methods=["GET", "POST"])
 def select_sheet():
-    xl = pd.ExcelFile(EXCEL_FILE)
-    sheets = xl.sheet_names
+    vocabulary = vocab.get_vocabulary()
+    pages = max(1, -(-len(vocabulary.sheet_names) // SHEETS_PER_PAGE))
+    page = min(max(request.args.get("page", 1, type=int), 1), pages)
+    sheets = vocabulary.sheet_names[(page - 1) * SHEETS_PER_PAGE:page * SHEETS_PER_PAGE]
 
     if request.method == "POST":
         choice = request.form.get("sheet")
-        if choice in sheets:
-            session["sheet_name"] = choice
-            # Load nouns for this sheet
-            session["nouns"] = [n.__dict__ for n in load_nouns(choice)]
-            # Initialize first noun
-            session["current_noun"] = pick_random_noun(session["nouns"])
-            # Reset score and guesses
-            session["points"] = 0
-            session["guesses"] = 0
+        if choice in vocabulary.sheets:
+            choose_sheet(vocabulary, choice)
             return "", 302, {"Location": "/select_mode"}  # go to select mode
         else:
             feedback = "Bitte wähle einen gültigen Wortschatz aus!"
     else:
         feedback = ""
+        # The page only changes with the workbook, a new score or the player
+        latest = leaderboard.latest_score()
+        last_modified = datetime.fromtimestamp(vocabulary.mtime, timezone.utc)
+        if latest:
+            last_modified = max(last_modified, as_datetime(latest[1]))
+        etag, last_modified, not_modified = page_validators(
+            "select_sheet", vocabulary.version, page, latest, session.get("player_name", ""),
+            last_modified=last_modified,
+        )
+        if not_modified:
+            return not_modified
+
+    # Sheet buttons and their leaderboards, for this page only
+    leaderboards = leaderboard.sheet_leaderboards(sheets)
+
+    response = make_response(render_template(
+        "select_sheet.html",
+        player_name=session.get("player_name", ""),
+        sheets=sheets,
+        leaderboards=leaderboards,
+        feedback=feedback,
+        page=page,
+        pages=pages,
+    ))
+    if request.method == "GET":
+        set_validators(response, etag, last_modified)
+    return response
+
+
+# A mix game samples several sheets at once. The session keeps only
+# [sheet id, weight] pairs, where a sheet id is its position in the
+# vocabulary version the game is pinned to.
+MIX_SHEET_NAME = "Mix"
+MIX_MAX_UNITS = 50
+MIX_MAX_WEIGHT = 10
+
+
+def parse_units(vocabulary, weights):
+    """[sheet id, weight] pairs from {sheet name: weight}, or None if they make no mix."""
+    ids = {name: i for i, name in enumerate(vocabulary.sheet_names)}
+    units = []
+    for name, weight in weights.items():
+        # Whole numbers only: form fields send digits, JSON sends ints
+        if weight is None or weight == "":
+            weight = 0
+        elif isinstance(weight, str) and weight.strip().isdecimal():
+            weight = int(weight)
+        elif type(weight) is not int:
+            return None
+        if name not in ids or not 0 <= weight <= MIX_MAX_WEIGHT:
+            return None
+        if weight and len(vocabulary.sheets[name]):
+            units.append([ids[name], weight])
+    if not units or len(units) > MIX_MAX_UNITS:
+        return None
+    return sorted(units)
+
+
+def choose_units(vocabulary, units):
+    session["sheet_name"] = MIX_SHEET_NAME
+    session["units"] = units
+    session["vocab_version"] = vocabulary.version
+    session.pop("deck", None)
+    session.pop("start_time", None)  # left over from an earlier challenge
+    session.pop("final_time", None)
+    session.pop("finished", None)
+    session["points"] = 0
+    session["guesses"] = 0
+
+
+@app.route("/select_units", methods=["GET", "POST"])
+def select_units():
+    vocabulary = vocab.get_vocabulary()
+    feedback = ""
+    if request.method == "POST":
+        units = parse_units(vocabulary, {
+            name: request.form.get(f"weight-{i}")
+            for i, name in enumerate(vocabulary.sheet_names)
+            if request.form.get(f"weight-{i}")
+        })
+        if units:
+            choose_units(vocabulary, units)
+            start_game("mix")
+            return "", 302, {"Location": "/"}
+        feedback = f"Bitte gib mindestens einem und höchstens {MIX_MAX_UNITS} Wortschätzen ein Gewicht!"
+    return render_template(
+        "select_units.html",
+        player_name=session.get("player_name", ""),
+        sheets=vocabulary.sheet_names,
+        max_weight=MIX_MAX_WEIGHT,
+        feedback=feedback,
+    )
+
+
+# Classroom races (see race.py). The teacher's session holds a token
+# that marks it as the host of the rooms it opened.
+def race_progress(deck, final_time=None):
+    room = race.get(session["race"])
+    if room is not None:
+        room.record(
+            session["player_name"], deck.size - deck.words_left(),
+            session["points"], session["guesses"], final_time,
+        )
+
+
+def race_host(room):
+    return session.get("race_token") is not None and session.get("race_token") == room.host
+
+
+@app.route("/race", methods=["GET", "POST"])
+def race_lobby():
+    if not session.get("player_name"):
+        return "", 302, {"Location": "/set_name"}
+    vocabulary = vocab.get_vocabulary()
+    feedback = ""
+    if request.args.get("code"):
+        return "", 302, {"Location": url_for("race_room", code=request.args["code"].strip().upper())}
+    if request.method == "POST":
+        sheet_name = request.form.get("sheet")
+        game_type = request.form.get("game_type")
+        if sheet_name in vocabulary.sheets and game_type in ["gender", "plural"]:
+            token = session.get("race_token") or secrets.token_urlsafe(16)
+            session["race_token"] = token
+            room = race.create(
+                token, sheet_name, game_type, vocabulary.version,
+                len(load_nouns(sheet_name, vocabulary)),
+            )
+            return "", 302, {"Location": url_for("race_room", code=room.code)}
+        feedback = "Bitte wähle einen Wortschatz und ein Spiel aus!"
+    return render_template("race_lobby.html", sheets=vocabulary.sheet_names, feedback=feedback)
+
+
+@app.route("/race/<code>")
+def race_room(code):
+    room = race.get(code)
+    if room is None:
+        return render_template("race_room.html", room=None, code=code), 404
+    name = session.get("player_name", "")
+    return render_template(
+        "race_room.html",
+        room=room,
+        host=race_host(room),
+        joined=session.get("race") == room.code and name in room.players,
+        name=name,
+    )
+
+
+@app.route("/race/<code>/join", methods=["POST"])
+def race_join(code):
+    room = race.get(code)
+    name = session.get("player_name")
+    if not name:
+        return "", 302, {"Location": "/set_name"}
+    if room is None:
+        return "", 302, {"Location": "/race"}
+    vocabulary = vocab.snapshot(room.vocab_version)
+    if vocabulary is None or not room.join(name):
+        return "", 302, {"Location": url_for("race_room", code=room.code)}
+    # Everyone draws from the same deck; the clock starts with the room
+    session.pop("units", None)
+    session.pop("start_time", None)
+    session.pop("current_noun", None)
+    session.pop("final_time", None)
+    session.pop("finished", None)
+    session["race"] = room.code
+    session["mode"] = "race"
+    session["game_type"] = room.game_type
+    session["sheet_name"] = room.sheet_name
+    session["vocab_version"] = room.vocab_version
+    session["deck"] = Deck(room.noun_count, seed=room.seed).state()
+    session["points"] = 0
+    session["guesses"] = 0
+    return "", 302, {"Location": url_for("race_room", code=room.code)}
+
+
+@app.route("/race/<code>/start", methods=["POST"])
+def race_start(code):
+    room = race.get(code)
+    if room is None or not race_host(room):
+        return "", 403
+    room.start()
+    return "", 302, {"Location": url_for("race_room", code=room.code)}
+
+
+@app.route("/race/<code>/finish", methods=["POST"])
+def race_finish(code):
+    room = race.get(code)
+    if room is None or not race_host(room):
+        return "", 403
+    room.finish()
+    return "", 302, {"Location": url_for("race_room", code=room.code)}
+
+
+@app.route("/race/<code>/events")
+def race_events(code):
+    room = race.get(code)
+    if room is None:
+        return "", 404
+    return Response(
+        race.stream(room, request.headers.get("Last-Event-ID")),
+        mimetype="text/event-stream",
+        # Proxies must pass every event through as soon as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# JSON game API, used by static/game.js to play without page reloads.
+# Answers are never sent ahead of time; every guess is graded here.
+API_BATCH_MAX = 50
+
+
+def api_noun(nouns, index):
+    return {"index": index, "word": nouns[index].word}
+
+
+def api_upcoming(nouns, deck, reviews, n):
+    """The nouns likely to follow the current one, for the client to prefetch."""
+    n = max(0, min(n, API_BATCH_MAX)) if isinstance(n, int) else 0
+    ahead = (deck or reviews).upcoming(n, session["current_noun"]) if n else []
+    return [api_noun(nouns, i) for i in ahead]
+
+
+def api_state(nouns, deck, reviews, n):
+    return {
+        "mode": session["mode"],
+        "game_type": session["game_type"],
+        "sheet": session["sheet_name"],
+        "start_time": session.get("start_time"),
+        "points": session["points"],
+        "guesses": session["guesses"],
+        "words_left": deck.words_left() if deck else None,
+        "current": api_noun(nouns, session["current_noun"]),
+        "upcoming": api_upcoming(nouns, deck, reviews, n),
+    }
+
+
+def api_body():
+    """The request's JSON object, {} without a body, or None if the body is not a JSON object."""
+    if not request.get_data(cache=True):
+        return {}
+    data = request.get_json(silent=True, force=True)
+    return data if isinstance(data, dict) else None
+
+
+def api_open_game():
+    """The session's game, or None if there is no game in progress."""
+    if any(key not in session for key in REQUIRED_SESSION_KEYS):
+        return None
+    vocabulary = game_vocabulary()
+    if not has_game(vocabulary):
+        return None
+    return open_game(vocabulary)
+
+
+@app.route("/api/game/start", methods=["POST"])
+def api_start():
+    data = api_body()
+    if data is None:
+        return {"error": "expected a JSON object"}, 400
+    name = str(data.get("name") or session.get("player_name") or "").strip()
+    game_type = data.get("game_type")
+    mode = data.get("mode")
+    vocabulary = vocab.get_vocabulary()
+    if not name:
+        return {"error": "name is required"}, 400
+    if game_type not in ["gender", "plural"]:
+        return {"error": "game_type must be gender or plural"}, 400
+    if mode not in ["practice", "challenge", "mix"]:
+        return {"error": "mode must be practice, challenge or mix"}, 400
+    if mode == "mix":
+        units = parse_units(vocabulary, data["units"]) if isinstance(data.get("units"), dict) else None
+        if units is None:
+            return {"error": f"units must map up to {MIX_MAX_UNITS} sheets to weights 0-{MIX_MAX_WEIGHT}"}, 400
+    elif not isinstance(data.get("sheet"), str) or data["sheet"] not in vocabulary.sheets:
+        return {"error": "unknown sheet"}, 400
+
+    session["player_name"] = name
+    session["game_type"] = game_type
+    if mode == "mix":
+        choose_units(vocabulary, units)
+    else:
+        choose_sheet(vocabulary, data["sheet"])
+    start_game(mode)
+    return api_state(*open_game(vocabulary), data.get("prefetch", 10))
+
+
+@app.route("/api/game/nouns")
+def api_nouns():
+    game = api_open_game()
+    if game is None:
+        return {"error": "no game in progress"}, 404
+    return api_state(*game, request.args.get("n", 10, type=int))
+
+
+@app.route("/api/game/guess", methods=["POST"])
+def api_guess():
+    data = api_body()
+    if data is None:
+        return {"error": "expected a JSON object"}, 400
+    game = api_open_game()
+    if game is None:
+        return {"error": "no game in progress"}, 404
+    nouns, deck, reviews = game
+    prefetch = data.get("prefetch", 0)
+    if data.get("index") != session["current_noun"]:
+        # The client answered a noun the server did not ask; resync it
+        return {"error": "stale", **api_state(nouns, deck, reviews, prefetch)}, 409
+
+    correct, feedback, finished = grade_guess(nouns, deck, reviews, str(data.get("guess", "")))
+    response = {
+        "correct": correct,
+        "feedback": str(escape(feedback)),
+        "points": session["points"],
+        "guesses": session["guesses"],
+        "done": finished,
+    }
+    if finished:
+        response["redirect"] = finished_url()
+    else:
+        response["words_left"] = deck.words_left() if deck else None
+        response["next"] = api_noun(nouns, session["current_noun"])
+        response["upcoming"] = api_upcoming(nouns, deck, reviews, prefetch)
+    return response
+
+
+@app.route("/api/game/result")
+def api_result():
+    if "final_time" not in session:
+        return {"error": "no finished challenge"}, 404
+    guesses = session.get("guesses", 0)
+    return {
+        "name": session.get("player_name", ""),
+        "sheet": session.get("sheet_name", ""),
+        "final_time": session["final_time"],
+        "points": session.get("points", 0),
+        "guesses": guesses,
+        "accuracy": round((session.get("points", 0) / guesses) * 100, 1) if guesses > 0 else 0,
+        "rank": leaderboard.player_rank(session.get("sheet_name", ""), session.get("player_name", "")),
+    }
+
+
+@app.route("/api/rank")
+def api_rank():
+    """A player's best on a sheet and where it ranks; defaults to the session's."""
+    sheet = request.args.get("sheet") or session.get("sheet_name")
+    player = request.args.get("player") or session.get("player_name")
+    if not sheet or not player:
+        return {"error": "sheet and player are required"}, 400
+    if sheet not in vocab.get_vocabulary().sheets:
+        return {"error": "unknown sheet"}, 404
+    rank = leaderboard.player_rank(sheet, player)
+    if rank is None:
+        return {"error": "no result for this player on this sheet"}, 404
+    return {"sheet": sheet, "player": player, **rank}
 
-    # Build sheet buttons and leaderboards
-    sheet_html = ""
-    conn = get_connection()
-    c = conn.cursor()
-
-    for sheet in sheets:
-        # Sheet button
-        sheet_html += f"""
-        <div class="sheet-card">
-            <h2>{sheet}</h2>
-            <form method="post">
-                <button type="submit" name="sheet" value="{sheet}">
-                    📘 {sheet}
-                </button>
-            </form>
-        """
-
-        # Leaderboard for this sheet (challenge mode only)
-        c.execute("""
-            SELECT *
-            FROM (
-                SELECT DISTINCT ON (player_name)
-                    player_name,
-                    final_time,
-                    accuracy
-                FROM scores
-                WHERE sheet_name = %s
-                ORDER BY player_name, accuracy DESC, final_time ASC
-            ) AS best_scores
-            ORDER BY accuracy DESC, final_time ASC
-            LIMIT 5
-        """, (sheet,))
-        rows = c.fetchall()
-
-        if rows:
-            sheet_html += "<div class='leaderboard'>"
-            sheet_html += "<div class='leaderboard-title'>🏆 LEADERBOARD</div><ul>"
-            for r in rows:
-                name = r[0]
-                total_seconds = int(r[1])
-                minutes = total_seconds // 60
-                seconds = total_seconds % 60
-                accuracy = r[2]
-                sheet_html += f"<li>{name} – {minutes}m {seconds}s ({accuracy}%)</li>"
-            sheet_html += "</ul></div>"
-        else:
-            sheet_html += "<div class='leaderboard'><em>No scores yet</em></div>"
-
-        sheet_html += "</div>"
-
-    conn.close()
-
-    return f"""
-    <html>
-    <head>
-        <title>Wortschatz wählen</title>
-        <style>
-            body {{
-                background: radial-gradient(circle at top, #1e1e2f, #121212);
-                color: #ffffff;
-                font-family: 'Segoe UI', sans-serif;
-                text-align: center;
-                padding: 40px;
-            }}
-    
-            h1 {{
-                font-size: 2.6em;
-                margin-bottom: 40px;
-            }}
-    
-            h2 {{
-                margin-top: 30px;
-                font-size: 1.8em;
-                color: #f1c40f;
-            }}
-    
-            .sheet-card {{
-                background: linear-gradient(145deg, #1f2937, #111827);
-                border-radius: 20px;
-                padding: 25px;
-                margin: 25px auto;
-                width: 70%;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.4);
-            }}
-    
-            .sheet-card button {{
-                font-size: 1.4em;
-                padding: 15px 40px;
-                border-radius: 15px;
-                border: none;
-                cursor: pointer;
-                background: linear-gradient(135deg, #3498db, #9b59b6);
-                color: white;
-                transition: transform 0.15s;
-                margin-top: 10px;
-            }}
-    
-            .sheet-card button:hover {{
-                transform: scale(1.08);
-            }}
-    
-            .leaderboard {{
-                margin-top: 20px;
-                background-color: rgba(255,255,255,0.05);
-                border-radius: 12px;
-                padding: 15px;
-            }}
-    
-            .leaderboard-title {{
-                font-weight: bold;
-                color: #2ecc71;
-                margin-bottom: 10px;
-            }}
-    
-            ul {{
-                list-style: none;
-                padding: 0;
-                margin: 0;
-            }}
-    
-            li {{
-                margin: 6px 0;
-                font-size: 1.1em;
-            }}
-        
-            .restart {{
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                font-size: 2em;
-                color: white;
-                text-decoration: none;
-            }}
-        
-            .restart:hover {{color: #e74c3c;}}
-        </style>
-
-    </head>
-    <body>
-        <a href="/full_reset" class="restart">✖</a>
-        <h1>{session.get('player_name', '')}, welchen Wortschatz möchtest du üben?</h1>
-        {sheet_html}
-        <p class="feedback">{feedback}</p>
-    </body>
-    </html>
-    """
 
 if __name__ == "__main__":
+    migrations.migrate()
     app.run(host="0.0.0.0", port=10000, debug=True)
\ No newline at end of file
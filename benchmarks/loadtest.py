@@ -0,0 +1,244 @@
+"""Drive the real game flow with many concurrent simulated players.
+
+    python benchmarks/loadtest.py --players 50 [--db sqlite] [--save-baseline F] [--compare F]
+
+Each player is a thread with its own keep-alive HTTP connection to the app
+served by werkzeug in this process. It goes through /set_name,
+/select_game, /select_sheet and /select_mode, then answers guesses on /
+until the challenge ends at /challenge_result. Answers are right with
+probability --accuracy, using the vocabulary as the answer key. The
+seeded RNG makes runs repeatable.
+
+Per route it reports p50/p95/p99 latency, mean response size and the
+largest cookie, plus overall throughput. --save-baseline writes these
+numbers as JSON. --compare exits non-zero when any route's p95 is more
+than --tolerance slower than the saved baseline.
+
+--db postgres (the default) needs DATABASE_URL and migrates it first.
+--db sqlite uses benchmarks/sqlite_standin.py against a temporary file.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NOUN_WORD = re.compile(r'<p class="noun-word">(.*?)</p>')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.size = defaultdict(list)
+        self.cookie = defaultdict(int)
+        self.errors = 0
+
+    def record(self, route, seconds, body_size, cookie_size):
+        with self.lock:
+            self.latency[route].append(seconds)
+            self.size[route].append(body_size)
+            self.cookie[route] = max(self.cookie[route], cookie_size)
+
+    def summary(self):
+        return {
+            route: {
+                "count": len(lat),
+                "p50_ms": percentile(lat, 50) * 1000,
+                "p95_ms": percentile(lat, 95) * 1000,
+                "p99_ms": percentile(lat, 99) * 1000,
+                "mean_bytes": statistics.mean(self.size[route]),
+                "max_cookie_bytes": self.cookie[route],
+            }
+            for route, lat in sorted(self.latency.items())
+        }
+
+
+class Player:
+    def __init__(self, port, name, stats, rng):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.name = name
+        self.stats = stats
+        self.rng = rng
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        start = time.perf_counter()
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        elapsed = time.perf_counter() - start
+
+        cookie_size = len(headers.get("Cookie", ""))
+        for header in response.msg.get_all("Set-Cookie") or ():
+            cookie_size = max(cookie_size, len(header))
+            name, _, rest = header.partition("=")
+            self.cookies[name] = rest.split(";", 1)[0]
+        self.stats.record(f"{method} {path}", elapsed, len(data), cookie_size)
+        if response.status >= 400:
+            with self.stats.lock:
+                self.stats.errors += 1
+            raise RuntimeError(f"{method} {path} -> {response.status}")
+        return response.status, response.getheader("Location"), data.decode("utf-8")
+
+    def play(self, game_type, sheet, answers, accuracy, max_guesses):
+        self.request("GET", "/set_name")
+        self.request("POST", "/set_name", {"name": self.name})
+        self.request("POST", "/select_game", {"game_type": game_type})
+        self.request("GET", "/select_sheet")
+        self.request("POST", "/select_sheet", {"sheet": sheet})
+        self.request("POST", "/select_mode", {"mode": "challenge"})
+        _, _, page = self.request("GET", "/")
+
+        for _ in range(max_guesses):
+            word = NOUN_WORD.search(page).group(1)
+            article, plural = answers[word]
+            right = self.rng.random() < accuracy
+            if game_type == "plural":
+                form = {"plural": plural if right else plural + "x"}
+            else:
+                form = {"article": article if right else "xyz"}
+            status, location, page = self.request("POST", "/", form)
+            if status == 302 and location and location.endswith("/challenge_result"):
+                self.request("GET", "/challenge_result")
+                return
+        raise RuntimeError(f"{self.name} did not finish within {max_guesses} guesses")
+
+
+def lift_limits():
+    # Simulated players guess far faster than people; measure the app, not
+    # the per-player limit. Admission control stays as configured.
+    os.environ.setdefault("GUESS_RATE", "1000000")
+    os.environ.setdefault("GUESS_BURST", "1000000")
+
+
+def prepare_database(kind):
+    if kind == "sqlite":
+        from benchmarks import sqlite_standin
+
+        path = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "scores.sqlite")
+        sqlite_standin.install(path)
+    else:
+        if not os.environ.get("DATABASE_URL"):
+            sys.exit("--db postgres needs DATABASE_URL")
+        import migrations
+
+        migrations.migrate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--db", choices=("postgres", "sqlite"), default="postgres")
+    parser.add_argument("--game-type", choices=("gender", "plural"), default="gender")
+    parser.add_argument("--sheet", help="sheet to play (default: first sheet)")
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    parser.add_argument("--max-guesses", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p95 slowdown against --compare (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    lift_limits()
+    prepare_database(args.db)
+
+    from werkzeug.serving import make_server
+
+    import app as game
+    import gameLogic
+    import vocab
+
+    sheet = args.sheet or vocab.sheet_names()[0]
+    answers = {n.word: (n.article, n.plural) for n in gameLogic.load_nouns(sheet)}
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, game.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stats = Stats()
+    failures = []
+
+    def run(i):
+        player = Player(server.port, f"loadtest-{i}", stats, random.Random(args.seed * 100_003 + i))
+        try:
+            player.play(args.game_type, sheet, answers, args.accuracy, args.max_guesses)
+        except Exception as e:
+            failures.append(f"{player.name}: {e}")
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.players)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    server.shutdown()
+
+    summary = stats.summary()
+    total = sum(r["count"] for r in summary.values())
+    print(f"{args.players} players, sheet {sheet!r}, {args.game_type}, db {args.db}")
+    print(f"{total} requests in {wall:.2f}s = {total / wall:.1f} req/s, {stats.errors} errors\n")
+    print(f"{'route':<24}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes':>9}{'cookie':>8}")
+    for route, r in summary.items():
+        print(f"{route:<24}{r['count']:>7}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['mean_bytes']:>9.0f}{r['max_cookie_bytes']:>8}")
+    for failure in failures[:10]:
+        print("FAILED", failure)
+
+    result = {
+        "players": args.players,
+        "db": args.db,
+        "game_type": args.game_type,
+        "sheet": sheet,
+        "throughput_rps": total / wall,
+        "routes": summary,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["routes"]
+        for route, r in summary.items():
+            base = baseline.get(route)
+            if base and r["p95_ms"] > base["p95_ms"] * (1 + args.tolerance):
+                regressions.append(f"{route}: p95 {base['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        for line in regressions:
+            print("REGRESSION", line)
+
+    sys.exit(1 if failures or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
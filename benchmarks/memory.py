@@ -0,0 +1,132 @@
+"""Compare the memory held for the vocabulary by the old and current Noun representations.
+
+    python benchmarks/memory.py [--scale N]
+
+"legacy" is what load_nouns used to keep per worker: a list per sheet of
+plain dataclass Nouns, five separate strings each, with empty cells read
+as "nan". "compact" is the current one: the memory-mapped store plus
+NounSequence, which creates slotted Noun views on demand. --scale repeats
+the workbook's sheets N times to stand in for a larger curriculum.
+
+Timings come from an untraced run. Python heap usage is measured with
+tracemalloc after loading every sheet, then again while reading every
+noun once. The store is reported separately because the page cache
+shares it between all workers. Compact reads are slower, since every
+read decodes its strings from the store; a request reads a handful.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import gameLogic  # noqa: E402
+import vocab  # noqa: E402
+
+
+@dataclass
+class LegacyNoun:
+    word: str
+    article: str
+    gender: str
+    plural: str
+    meaning: str
+
+
+def legacy_load(sheets):
+    # Every cell was parsed into its own string object, empty ones as "nan"
+    return None, {
+        name: [
+            LegacyNoun(
+                word=word.decode(),
+                article=article.decode(),
+                gender=gameLogic.GENDER_MAP.get(article.decode().lower()),
+                plural=plural.decode() or "nan",
+                meaning=meaning.decode() or "nan",
+            )
+            for word, article, plural, meaning in rows
+        ]
+        for name, rows in sheets.items()
+    }
+
+
+def compact_load(path):
+    vocabulary = vocab.Vocabulary(*vocab._read_store(path))
+    return vocabulary, {name: gameLogic.load_nouns(name, vocabulary) for name in vocabulary.sheet_names}
+
+
+def read_all(loaded):
+    count = 0
+    for nouns in loaded.values():
+        for noun in nouns:
+            count += len(noun.word) + len(noun.article)
+    return count
+
+
+def measure(load, *args):
+    """Timings from an untraced run, then heap usage from a traced one."""
+    start = time.perf_counter()
+    nouns = load(*args)[1]
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    read_all(nouns)
+    read_seconds = time.perf_counter() - start
+    del nouns
+
+    tracemalloc.start()
+    result = load(*args)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    read_all(result[1])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, held, peak, load_seconds, read_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    base = vocab._parse_workbook(vocab.EXCEL_FILE)
+    sheets = {
+        f"{name} #{copy}" if copy else name: rows
+        for copy in range(args.scale)
+        for name, rows in base.items()
+    }
+    nouns = sum(len(rows) for rows in sheets.values())
+
+    store = os.path.join(tempfile.mkdtemp(prefix="vocab-memory-"), "store.bin")
+    vocab._write_store(store, vocab.Vocabulary(0.0, "00" * 32, sheets))
+    # The legacy loader decodes its own strings, as a fresh parse would
+    raw = {name: [tuple(v.encode() for v in row) for row in rows] for name, rows in sheets.items()}
+    del sheets, base
+
+    legacy, l_held, l_peak, l_load, l_read = measure(legacy_load, raw)
+    sample = next(iter(legacy[1].values()))[0]
+    legacy_noun = sys.getsizeof(sample) + sys.getsizeof(sample.__dict__)
+    del legacy
+    compact, c_held, c_peak, c_load, c_read = measure(compact_load, store)
+    compact_noun = sys.getsizeof(next(iter(compact[1].values()))[0])
+
+    print(f"{len(raw)} sheets, {nouns} nouns (scale {args.scale})\n")
+    print(f"{'':<10}{'held KiB':>10}{'peak read KiB':>15}{'load ms':>10}{'read ms':>10}{'Noun B':>8}")
+    for name, held, peak, load, read, size in (
+        ("legacy", l_held, l_peak, l_load, l_read, legacy_noun),
+        ("compact", c_held, c_peak, c_load, c_read, compact_noun),
+    ):
+        print(f"{name:<10}{held / 1024:>10.1f}{peak / 1024:>15.1f}{load * 1000:>10.2f}"
+              f"{read * 1000:>10.2f}{size:>8}")
+    print(f"\nshared store: {os.path.getsize(store) / 1024:.1f} KiB "
+          f"({vocab._NOUN.size} bytes per noun record)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""SQLite stand-in for the Postgres database, for load tests without a server.
+
+Call install() before importing app. It points the connection pool at a
+SQLite file and translates the few Postgres-only constructs the game flow
+uses. It only covers the statements the benchmark exercises, and its
+timings say nothing about Postgres query plans.
+"""
+
+import csv
+import json
+import re
+import sqlite3
+
+import psycopg2.extensions
+import psycopg2.extras
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_name TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    guesses INTEGER NOT NULL,
+    accuracy REAL NOT NULL,
+    final_time REAL DEFAULT 0,
+    sheet_name TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS best_scores (
+    sheet_name TEXT NOT NULL,
+    player_name TEXT NOT NULL,
+    accuracy REAL NOT NULL,
+    final_time REAL NOT NULL,
+    score_id INTEGER NOT NULL,
+    PRIMARY KEY (sheet_name, player_name)
+);
+CREATE INDEX IF NOT EXISTS best_scores_rank_idx
+    ON best_scores (sheet_name, accuracy DESC, final_time ASC);
+CREATE INDEX IF NOT EXISTS best_scores_player_idx ON best_scores (player_name);
+CREATE INDEX IF NOT EXISTS scores_time_idx ON scores (timestamp, id);
+CREATE INDEX IF NOT EXISTS scores_player_time_idx ON scores (player_name, timestamp, id);
+CREATE INDEX IF NOT EXISTS scores_accuracy_idx ON scores (accuracy DESC);
+CREATE TABLE IF NOT EXISTS review_state (
+    player_name TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    state BLOB NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (player_name, sheet_name, game_type)
+);
+CREATE TABLE IF NOT EXISTS guess_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    player_name TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    noun_index INTEGER NOT NULL,
+    noun TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS noun_stats (
+    sheet_name TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    noun TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    misses INTEGER NOT NULL,
+    latency_ms_total INTEGER NOT NULL,
+    PRIMARY KEY (sheet_name, game_type, noun)
+);
+CREATE TABLE IF NOT EXISTS player_stats (
+    player_name TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms_total INTEGER NOT NULL,
+    last_guess_at TEXT NOT NULL,
+    PRIMARY KEY (player_name, sheet_name, game_type)
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    source TEXT,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS sheets_position_idx ON sheets (position, id);
+CREATE INDEX IF NOT EXISTS sheets_updated_idx ON sheets (updated_at);
+CREATE TABLE IF NOT EXISTS nouns (
+    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+    word TEXT NOT NULL,
+    article TEXT NOT NULL,
+    plural TEXT NOT NULL,
+    meaning TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (sheet_id, word)
+);
+CREATE INDEX IF NOT EXISTS nouns_position_idx ON nouns (sheet_id, position);
+"""
+
+# fetch_sheet_leaderboards walks the index with a LATERAL join over
+# unnest(); SQLite gets the equivalent window query
+_LATERAL_TOP_N = """
+    SELECT sheet_name, player_name, final_time, accuracy FROM (
+        SELECT sheet_name, player_name, final_time, accuracy,
+               ROW_NUMBER() OVER (
+                   PARTITION BY sheet_name ORDER BY accuracy DESC, final_time ASC
+               ) AS rank
+        FROM best_scores
+        WHERE sheet_name IN (SELECT value FROM json_each(?))
+    ) WHERE rank <= ?
+"""
+
+
+def translate(sql, params):
+    """Rewrite one Postgres statement for SQLite; None means skip it."""
+    if "pg_advisory" in sql:
+        return None
+    params = tuple(params or ())
+    if "unnest(" in sql:
+        return _LATERAL_TOP_N, (json.dumps(list(params[0])),) + params[1:]
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\bnow\(\)", "CURRENT_TIMESTAMP", sql)
+    sql = sql.replace("GREATEST(", "MAX(")
+    return sql, params
+
+
+class Cursor:
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+
+    def execute(self, sql, params=None):
+        translated = translate(sql, params)
+        if translated is not None:
+            self._cur.execute(*translated)
+
+    def copy_expert(self, sql, file):
+        # Only "COPY table (columns) FROM STDIN WITH (FORMAT csv)"
+        table, columns = re.match(r"\s*COPY (\w+) \(([^)]*)\) FROM STDIN", sql).groups()
+        placeholders = ", ".join("?" * len(columns.split(",")))
+        self._cur.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", csv.reader(file)
+        )
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.closed = 0
+
+    def cursor(self):
+        return Cursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = 1
+
+    def get_transaction_status(self):
+        if self._conn.in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False):
+    """Multi-row VALUES expansion with the signature of psycopg2's helper."""
+    rows = [tuple(args) for args in argslist]
+    results = []
+    for start in range(0, len(rows), page_size):
+        page = rows[start:start + page_size]
+        values = ", ".join("(" + ", ".join(["%s"] * len(row)) + ")" for row in page)
+        cur.execute(sql.replace("VALUES %s", "VALUES " + values), [v for row in page for v in row])
+        if fetch:
+            results.extend(cur.fetchall())
+    return results if fetch else None
+
+
+def install(path):
+    """Route the app's database access to a SQLite file. Call before importing app."""
+    import database
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.close()
+
+    psycopg2.extras.execute_values = execute_values
+    database.ConnectionPool._connect = lambda self: Connection(path)
+    database.ConnectionPool._healthy = lambda self, conn, idle_for: not conn.closed
@@ -0,0 +1,69 @@
+"""Time how long a fresh interpreter takes to import app.py.
+
+    python benchmarks/startup.py [--runs N] [--baseline GIT_REV]
+
+With --baseline the same measurement is taken on a checkout of GIT_REV
+(extracted with git archive) so the two can be compared. Older revisions
+touch the database at import, so DATABASE_URL must point at a reachable
+server for them.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import sys, time; t = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t, 'pandas' in sys.modules)"
+)
+
+
+def measure(tree, runs):
+    imports, walls = [], []
+    pandas = False
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=tree, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        walls.append(time.perf_counter() - start)
+        imports.append(float(out[-2]))
+        pandas = out[-1] == "True"
+    return imports, walls, pandas
+
+
+def report(label, imports, walls, pandas):
+    print(
+        f"{label:<10} import median {statistics.median(imports) * 1000:8.1f} ms"
+        f"   min {min(imports) * 1000:8.1f} ms"
+        f"   process median {statistics.median(walls) * 1000:8.1f} ms"
+        f"   pandas loaded: {'yes' if pandas else 'no'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--baseline", help="git revision to compare against")
+    args = parser.parse_args()
+
+    report("current", *measure(ROOT, args.runs))
+
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tree:
+            archive = subprocess.run(
+                ["git", "archive", args.baseline], cwd=ROOT, capture_output=True, check=True
+            ).stdout
+            subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+            report(args.baseline[:10], *measure(tree, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,219 @@
 import psycopg2
 import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
 print("DATABASE_URL =", DATABASE_URL)
 
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+# Connections idle for longer than this are pinged before being handed out
+POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", 30))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
 def get_connection():
+    """Open a dedicated, unpooled connection. Prefer connection()."""
     return psycopg2.connect(DATABASE_URL)
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with checkout health checks."""
+
+    def __init__(self, dsn, minconn=POOL_MIN, maxconn=POOL_MAX,
+                 timeout=POOL_TIMEOUT, ping_after=POOL_PING_AFTER):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at), most recent last
+        self._size = 0
+
+        self.checkouts = 0
+        self.exhausted = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn)
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as c:
+                c.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self.discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            create = False
+            with self._cond:
+                counted_exhaustion = False
+                while not self._idle and self._size >= self.maxconn:
+                    if not counted_exhaustion:
+                        self.exhausted += 1
+                        counted_exhaustion = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"no database connection free after {self.timeout}s"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, time.monotonic() - returned_at):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            return conn
+
+    def putconn(self, conn):
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        if not healthy:
+            self._discard(conn)
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "max": self.maxconn,
+                "checkouts": self.checkouts,
+                "exhausted": self.exhausted,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's pool, creating it on first use (and after fork)."""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(DATABASE_URL)
+    return _pool
+
+
+@metrics.REGISTRY.collector
+def _pool_metrics():
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        return []
+    s = pool.stats()
+    return [
+        ("db_pool_connections", "gauge", "Open pooled connections.",
+         {(("state", "idle"),): s["idle"], (("state", "in_use"),): s["size"] - s["idle"]}),
+        ("db_pool_max_connections", "gauge", "Pool size limit.", {(): s["max"]}),
+        ("db_pool_checkouts_total", "counter", "Connections handed out.", {(): s["checkouts"]}),
+        ("db_pool_exhausted_total", "counter", "Checkouts that had to wait for a free connection.",
+         {(): s["exhausted"]}),
+        ("db_pool_timeouts_total", "counter", "Checkouts that gave up waiting.", {(): s["timeouts"]}),
+        ("db_pool_discarded_total", "counter", "Broken connections thrown away.", {(): s["discarded"]}),
+    ]
+
+
+@contextmanager
+def connection(query="other"):
+    """Check a pooled connection out for the duration of the block.
+
+    Commits when the block finishes cleanly and rolls back on error. The
+    time the connection is held is recorded under ``query``.
+    """
+    pool = get_pool()
+    start = time.perf_counter()
+    conn = pool.getconn()
+    checked_out = time.perf_counter()
+    metrics.db_wait_seconds.observe(checked_out - start)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        pool.putconn(conn)
+        metrics.db_seconds.observe(time.perf_counter() - checked_out, query)
@@ -0,0 +1,106 @@
+import csv
+import io
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from database import connection
+from writebehind import BatchWriter
+
+# Longest answer time recorded; anything above is a player who walked away
+MAX_LATENCY_MS = 10 * 60 * 1000
+
+_EVENT_COLUMNS = (
+    "created_at", "player_name", "sheet_name", "game_type",
+    "noun_index", "noun", "correct", "latency_ms",
+)
+
+
+def _copy_events(c, records):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in records:
+        writer.writerow([
+            r["at"], r["player"], r["sheet"], r["game_type"],
+            r["index"], r["noun"], "t" if r["correct"] else "f", r["latency_ms"],
+        ])
+    buf.seek(0)
+    c.copy_expert(
+        f"COPY guess_events ({', '.join(_EVENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf
+    )
+
+
+def _rollup(records):
+    """Sum a batch into per-noun and per-player counter deltas."""
+    nouns = defaultdict(lambda: [0, 0, 0])
+    players = defaultdict(lambda: [0, 0, 0, ""])
+    for r in records:
+        n = nouns[(r["sheet"], r["game_type"], r["noun"])]
+        n[0] += 1
+        n[1] += not r["correct"]
+        n[2] += r["latency_ms"]
+        p = players[(r["player"], r["sheet"], r["game_type"])]
+        p[0] += 1
+        p[1] += bool(r["correct"])
+        p[2] += r["latency_ms"]
+        p[3] = max(p[3], r["at"])
+    # Sorted, so concurrent flushes lock counter rows in the same order
+    return (
+        [key + tuple(v) for key, v in sorted(nouns.items())],
+        [key + tuple(v) for key, v in sorted(players.items())],
+    )
+
+
+def _flush_events(records):
+    """COPY a batch into guess_events and fold it into the counters, in one transaction."""
+    noun_rows, player_rows = _rollup(records)
+    with connection("guess_events") as conn:
+        c = conn.cursor()
+        _copy_events(c, records)
+        execute_values(c, """
+            INSERT INTO noun_stats (sheet_name, game_type, noun, attempts, misses, latency_ms_total)
+            VALUES %s
+            ON CONFLICT (sheet_name, game_type, noun) DO UPDATE
+            SET attempts = noun_stats.attempts + EXCLUDED.attempts,
+                misses = noun_stats.misses + EXCLUDED.misses,
+                latency_ms_total = noun_stats.latency_ms_total + EXCLUDED.latency_ms_total
+        """, noun_rows)
+        execute_values(c, """
+            INSERT INTO player_stats
+                (player_name, sheet_name, game_type, attempts, correct, latency_ms_total, last_guess_at)
+            VALUES %s
+            ON CONFLICT (player_name, sheet_name, game_type) DO UPDATE
+            SET attempts = player_stats.attempts + EXCLUDED.attempts,
+                correct = player_stats.correct + EXCLUDED.correct,
+                latency_ms_total = player_stats.latency_ms_total + EXCLUDED.latency_ms_total,
+                last_guess_at = GREATEST(player_stats.last_guess_at, EXCLUDED.last_guess_at)
+        """, player_rows)
+
+
+_writer = BatchWriter(
+    "guesses",
+    _flush_events,
+    batch_size=int(os.environ.get("GUESS_FLUSH_SIZE", 500)),
+    interval=float(os.environ.get("GUESS_FLUSH_INTERVAL", 2.0)),
+    max_pending=int(os.environ.get("GUESS_QUEUE_MAX", 50_000)),
+    spill_dir=os.environ.get("GUESS_SPILL_DIR"),
+)
+
+
+def record_guess(player_name, sheet_name, game_type, noun_index, noun, correct, latency):
+    """Queue one guess event; it reaches the database with the next batch.
+
+    Returns False when the queue is full and the event was dropped.
+    """
+    return _writer.submit({
+        "at": datetime.now(timezone.utc).isoformat(),
+        "player": player_name,
+        "sheet": sheet_name,
+        "game_type": game_type,
+        "index": noun_index,
+        "noun": noun,
+        "correct": correct,
+        "latency_ms": min(max(int(latency * 1000), 0), MAX_LATENCY_MS),
+    })
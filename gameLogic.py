@@ -1,46 +1,446 @@
+import bisect
 import random
+import re
+from collections.abc import Sequence
 from dataclasses import dataclass
-import pandas as pd
 
-EXCEL_FILE = "AlleLernwortschatze.xlsx"
-xl = pd.ExcelFile(EXCEL_FILE)
+import vocab
+from vocab import EXCEL_FILE
 
-@dataclass
+
+GENDERS = ("masculine", "feminine", "neuter")
+GENDER_MAP = dict(zip(vocab.ARTICLES, GENDERS))
+
+
+# Not frozen: a frozen dataclass takes four times as long to build, and
+# one is built on every read
+@dataclass(slots=True)
 class Noun:
+    """A view of one vocabulary row; the article is a code into vocab.ARTICLES."""
+
     word: str
-    article: str
-    gender: str
+    article_code: int
     plural: str
     meaning: str
 
+    @property
+    def article(self) -> str:
+        return vocab.ARTICLES[self.article_code] if self.article_code != vocab.NO_ARTICLE else ""
+
+    @property
+    def gender(self) -> str | None:
+        return GENDERS[self.article_code] if self.article_code != vocab.NO_ARTICLE else None
+
+_MASK64 = (1 << 64) - 1
+
+# How the Plural column marks nouns whose plural is the singular ("-")
+# and nouns with no plural at all ("-----")
+SAME_AS_SINGULAR = "-"
+NO_PLURAL_ANSWERS = ("-", "keinplural", "kein", "nursingular")
+# Several accepted plurals are listed as "Pizzas / Pizzen", "Pizzas, Pizzen", ...
+_VARIANT_SEPARATORS = re.compile(r"\s*(?:[,;/|]|\boder\b)\s*")
+
+_UMLAUT_FOLD = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_UMLAUT_DROP = str.maketrans({"ä": "a", "ö": "o", "ü": "u"})
+
+# Near-misses are only forgiven in longer words, and never in the last
+# letters, where the plural ending is
+TYPO_MIN_LENGTH = 6
+TYPO_MAX_EDITS = 1
+TYPO_PROTECTED_SUFFIX = 2
+
+
+def normalise(text: str) -> str:
+    return "".join(text.lower().split())
+
+
+def fold_umlauts(text: str) -> str:
+    """Spell umlauts and ß the way a keyboard without them would (ä -> ae)."""
+    return text.translate(_UMLAUT_FOLD)
+
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """True if the Levenshtein distance between a and b is at most ``limit``.
+
+    Only the band of ``limit`` cells either side of the diagonal is
+    computed, and the scan stops as soon as a whole row exceeds the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    too_far = limit + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= limit else too_far
+        best = current[0]
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost, too_far)
+            best = min(best, current[j])
+        if best > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+
+class PluralAnswers:
+    """Every accepted answer for one noun's plural, normalised once up front.
+
+    ``exact`` holds the normalised variants (also with the article "die"
+    in front), ``folded`` the same with umlauts folded, and ``targets``
+    the folded variants long enough to forgive a typo in. ``bare`` holds
+    the variants with their umlauts dropped (Hauser for Häuser), which are
+    never a typo: the umlaut is often what marks the plural.
+    """
+
+    __slots__ = ("display", "exact", "folded", "targets", "bare", "singular")
 
-GENDER_MAP = {
-    "der": "masculine",
-    "die": "feminine",
-    "das": "neuter"
-}
+    def __init__(self, noun: Noun):
+        plural = noun.plural.strip()
+        if plural and not plural.strip("-"):
+            if plural == SAME_AS_SINGULAR:
+                # Same form as the singular (der Koffer, die Koffer): the
+                # word itself, or the sheet's own "-"
+                variants = [noun.word]
+                forms = {normalise(noun.word)}
+            else:
+                variants = []
+                forms = set(NO_PLURAL_ANSWERS)
+            forms.add(normalise(plural))  # the sheet's own dashes
+            self.display = noun.word if variants else "kein Plural"
+        else:
+            variants = [v for v in _VARIANT_SEPARATORS.split(plural) if v]
+            forms = {normalise(v) for v in variants}
+            self.display = plural
+        forms |= {"die" + normalise(v) for v in variants}
+        self.exact = frozenset(forms)
+        self.folded = frozenset(fold_umlauts(form) for form in forms)
+        self.targets = tuple(
+            fold_umlauts(normalise(v)) for v in variants
+            if len(normalise(v)) >= TYPO_MIN_LENGTH
+        )
+        self.bare = frozenset(fold_umlauts(normalise(v).translate(_UMLAUT_DROP)) for v in variants)
+        self.singular = fold_umlauts(normalise(noun.word))
 
+    def match(self, guess: str) -> str | None:
+        """Grade a guess: "exact", "folded", "typo", or None if it is wrong."""
+        guess = normalise(guess)
+        if guess in self.exact:
+            return "exact"
+        guess = fold_umlauts(guess)
+        if guess in self.folded:
+            return "folded"
+        candidates = [guess[3:], guess] if guess.startswith("die") else [guess]
+        if self.singular in candidates or not self.bare.isdisjoint(candidates):
+            return None  # the singular is never a typo of the plural (Mutter, Mütter)
+        for candidate in candidates:
+            for target in self.targets:
+                if (candidate[-TYPO_PROTECTED_SUFFIX:] == target[-TYPO_PROTECTED_SUFFIX:]
+                        and within_distance(candidate, target, TYPO_MAX_EDITS)):
+                    return "typo"
+        return None
 
-def pick_random_noun(nouns: list[Noun]) -> Noun:
-    return random.choice(nouns)
 
+def load_plural_answers(sheet_name: str, vocabulary: vocab.Vocabulary | None = None) -> list[PluralAnswers]:
+    """Answer index for a sheet, parallel to load_nouns(); built once per vocabulary."""
+    if vocabulary is None:
+        vocabulary = vocab.get_vocabulary()
+    key = ("plural", sheet_name)
+    answers = vocabulary.noun_cache.get(key)
+    if answers is None:
+        answers = [PluralAnswers(noun) for noun in load_nouns(sheet_name, vocabulary)]
+        vocabulary.noun_cache[key] = answers
+    return answers
 
-def load_nouns(sheet_name: str, ):
+
+def pick_random_noun(indices: Sequence[int]) -> int:
+    """Pick the next noun, as an index into its sheet's noun list."""
+    return random.choice(indices)
+
+
+class NounSequence(Sequence[Noun]):
+    """A sheet's nouns, each built from its vocabulary row when it is read.
+
+    No Noun objects are kept, so a worker holds no per-sheet copy of the
+    vocabulary beyond the shared store.
+    """
+
+    __slots__ = ("_rows",)
+
+    def __init__(self, rows: Sequence[tuple[str, str, str, str]]):
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        word, article, plural, meaning = self._rows[index]
+        return Noun(word, vocab.ARTICLE_CODES.get(article, vocab.NO_ARTICLE), plural, meaning)
+
+
+def load_nouns(sheet_name: str, vocabulary: vocab.Vocabulary | None = None) -> NounSequence:
+    """Return the nouns of a sheet from ``vocabulary`` (default: the current one)."""
+    if vocabulary is None:
+        vocabulary = vocab.get_vocabulary()
     if sheet_name is None:
-        sheet_name = xl.sheet_names[0]
-    df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
-    nouns = []
-    for _, row in df.iterrows():
-        nouns.append(Noun(
-            word=row["Nomen"],
-            article=row["Artikel"],
-            gender=GENDER_MAP.get(row["Artikel"].lower()),
-            plural=str(row["Plural"]),
-            meaning=str(row["Übersetzung"])
-        ))
+        sheet_name = vocabulary.sheet_names[0]
+
+    nouns = vocabulary.noun_cache.get(sheet_name)
+    if nouns is None:
+        nouns = NounSequence(vocabulary.sheets[sheet_name])
+        vocabulary.noun_cache[sheet_name] = nouns
     return nouns
 
 
-def check_article(noun: Noun, guess: str) -> bool:
-    return guess.lower() == noun.article.lower()
+def _mix64(x: int) -> int:
+    """SplitMix64 finaliser, used as the Feistel round function."""
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class Deck:
+    """Challenge deck over the noun indices 0..size-1 of one sheet.
+
+    The draw order is a seeded pseudo-random permutation evaluated on the
+    fly (a small Feistel network with cycle walking), reshuffled on every
+    pass, so no list of indices is ever stored. The whole state is the
+    seed, the cursor position and a bitset of nouns already answered.
+
+    Late in a game most positions of a pass are done, so a draw tries at
+    most MAX_STEPS positions and then takes the first open noun after the
+    last one tried, found with a few operations on the bitset. A draw
+    therefore costs the same however few words are left.
+    """
+
+    ROUNDS = 4
+    MAX_STEPS = 4
+
+    def __init__(self, size: int, seed: int | None = None, pos: int = 0, done: int = 0):
+        self.size = size
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.pos = pos
+        self.done = done
+        # Feistel domain is 4**half_bits >= size, so cycle walking takes
+        # fewer than four steps on average
+        self._half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+
+    @classmethod
+    def from_state(cls, size: int, state: list[int]) -> "Deck":
+        seed, pos, done = state
+        return cls(size, seed, pos, done)
+
+    def state(self) -> list[int]:
+        return [self.seed, self.pos, self.done]
 
+    def _permute(self, i: int, round_key: int) -> int:
+        half = self._half_bits
+        mask = (1 << half) - 1
+        while True:
+            left, right = i >> half, i & mask
+            for r in range(self.ROUNDS):
+                left, right = right, left ^ (_mix64(round_key + r + (right << 8)) & mask)
+            i = (left << half) | right
+            if i < self.size:
+                return i
+
+    def words_left(self) -> int:
+        return self.size - self.done.bit_count()
+
+    def draw(self) -> int | None:
+        """Return the next noun index that is not done yet, or None if finished."""
+        if self.words_left() == 0:
+            return None
+        for _ in range(self.MAX_STEPS):
+            pass_no, offset = divmod(self.pos, self.size)
+            self.pos += 1
+            index = self._permute(offset, _mix64(self.seed ^ (pass_no << 32)))
+            if not (self.done >> index) & 1:
+                return index
+        open_bits = ~self.done & ((1 << self.size) - 1)
+        after = open_bits >> index
+        if not after:
+            after, index = open_bits, 0  # wrap around to the lowest open noun
+        return index + (after & -after).bit_length() - 1
+
+    def upcoming(self, n: int, current: int | None = None) -> list[int]:
+        """The next ``n`` draws if ``current`` and every one after it are answered correctly."""
+        ahead = Deck(self.size, self.seed, self.pos, self.done)
+        if current is not None:
+            ahead.mark_done(current)
+        indices = []
+        while len(indices) < n:
+            index = ahead.draw()
+            if index is None:
+                break
+            ahead.mark_done(index)
+            indices.append(index)
+        return indices
+
+    def mark_done(self, index: int) -> None:
+        self.done |= 1 << index
+
+    def requeue(self, index: int) -> None:
+        """Put a noun back so it comes round again on a later pass."""
+        self.done &= ~(1 << index)
+
+
+class VocabularyIndex(Sequence[Noun]):
+    """Every noun of a vocabulary under one index, sheet after sheet.
+
+    Sheet ``i`` (its position in ``sheet_names``) holds the indices
+    ``offsets[i]`` up to ``offsets[i + 1]``. Nouns are read through each
+    sheet's NounSequence, so nothing is copied.
+    """
+
+    def __init__(self, vocabulary: vocab.Vocabulary):
+        self._vocabulary = vocabulary
+        self.offsets = [0]
+        for name in vocabulary.sheet_names:
+            self.offsets.append(self.offsets[-1] + len(vocabulary.sheets[name]))
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def locate(self, index: int) -> tuple[str, int]:
+        """(sheet name, index within that sheet) of a noun."""
+        sheet = bisect.bisect_right(self.offsets, index) - 1
+        return self._vocabulary.sheet_names[sheet], index - self.offsets[sheet]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        sheet_name, local = self.locate(index)
+        return load_nouns(sheet_name, self._vocabulary)[local]
+
+
+def load_vocabulary_index(vocabulary: vocab.Vocabulary | None = None) -> VocabularyIndex:
+    if vocabulary is None:
+        vocabulary = vocab.get_vocabulary()
+    index = vocabulary.noun_cache.get(("index",))
+    if index is None:
+        index = vocabulary.noun_cache[("index",)] = VocabularyIndex(vocabulary)
+    return index
+
+
+class AliasTable:
+    """Vose's alias method: pick() returns i with probability weights[i] / sum(weights).
+
+    Built in O(n); every pick is one multiply and one comparison.
+    """
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("weights must have a positive sum")
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # Whatever is left over is 1 up to rounding and keeps prob 1.0
+
+    def pick(self, u: float) -> int:
+        """The index for a uniform ``u`` in [0, 1)."""
+        u *= len(self.prob)
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+
+# Distinct unit mixes kept per vocabulary before the cache starts over
+MIX_CACHE_MAX = 256
+
+
+def load_unit_mix(units: Sequence[Sequence[int]], vocabulary: vocab.Vocabulary | None = None):
+    """(alias table, first index, noun count) per unit for [sheet id, weight] pairs.
+
+    Sheet ids are positions in the vocabulary's ``sheet_names`` and the
+    indices are VocabularyIndex ones. Built once per mix and vocabulary.
+    """
+    if vocabulary is None:
+        vocabulary = vocab.get_vocabulary()
+    cache = vocabulary.noun_cache.setdefault(("mix",), {})
+    key = tuple((sheet_id, weight) for sheet_id, weight in units)
+    mix = cache.get(key)
+    if mix is None:
+        offsets = load_vocabulary_index(vocabulary).offsets
+        bases = [offsets[sheet_id] for sheet_id, _ in key]
+        sizes = [offsets[sheet_id + 1] - offsets[sheet_id] for sheet_id, _ in key]
+        # An empty sheet can never be drawn
+        table = AliasTable([weight if size else 0 for (_, weight), size in zip(key, sizes)])
+        if len(cache) >= MIX_CACHE_MAX:
+            cache.clear()
+        mix = cache[key] = (table, bases, sizes)
+    return mix
+
+
+class UnitSampler:
+    """Endless draws across several sheets, each picked in proportion to its weight.
+
+    A draw picks a unit from the alias table and then a noun uniformly
+    within it, so it is O(1) however many sheets are mixed. Draw ``k`` is
+    a hash of (seed, k): the whole state is the seed and the cursor, and
+    upcoming() can predict draws the way Deck.upcoming() does.
+    """
+
+    RETRIES = 3  # redraws to avoid asking the same noun twice in a row
+
+    def __init__(self, table: AliasTable, bases: list[int], sizes: list[int],
+                 seed: int | None = None, pos: int = 0):
+        self.table = table
+        self.bases = bases
+        self.sizes = sizes
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.pos = pos
+
+    @classmethod
+    def from_state(cls, mix, state: list[int]) -> "UnitSampler":
+        seed, pos = state
+        return cls(*mix, seed, pos)
+
+    def state(self) -> list[int]:
+        return [self.seed, self.pos]
+
+    def _at(self, k: int) -> int:
+        h = _mix64((self.seed * 0x9E3779B97F4A7C15 + k) & _MASK64)
+        unit = self.table.pick((h >> 11) / (1 << 53))
+        return self.bases[unit] + _mix64(h) % self.sizes[unit]
+
+    def _draw(self, pos: int, exclude: int | None) -> tuple[int, int]:
+        for _ in range(self.RETRIES + 1):
+            index = self._at(pos)
+            pos += 1
+            if index != exclude:
+                break
+        return index, pos
+
+    def next(self, exclude: int | None = None) -> int:
+        index, self.pos = self._draw(self.pos, exclude)
+        return index
+
+    def upcoming(self, n: int, current: int | None = None) -> list[int]:
+        """The next ``n`` draws after ``current``."""
+        indices = []
+        pos = self.pos
+        for _ in range(n):
+            current, pos = self._draw(pos, current)
+            indices.append(current)
+        return indices
+
+
+def check_article(noun: Noun, guess: str) -> bool:
+    return vocab.ARTICLE_CODES.get(guess.strip().lower()) == noun.article_code
@@ -0,0 +1,81 @@
+import base64
+import binascii
+from datetime import datetime
+
+from database import connection
+
+PAGE_SIZE = 25
+
+_COLUMNS = "id, player_name, sheet_name, points, guesses, accuracy, final_time, timestamp"
+
+
+def encode_cursor(row):
+    """Opaque page token for the (timestamp, id) position of a row."""
+    ts = row[7] if isinstance(row[7], str) else row[7].isoformat()
+    return base64.urlsafe_b64encode(f"{ts}|{row[0]}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(timestamp, id) from a page token, or None if it is malformed."""
+    if not token:
+        return None
+    try:
+        ts, _, score_id = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode().rpartition("|")
+        datetime.fromisoformat(ts)  # checked here rather than failing in the query
+        return ts, int(score_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def fetch_page(player_name=None, before=None, after=None, limit=PAGE_SIZE):
+    """One page of scores, newest first, optionally for a single player.
+
+    Keyset pagination on (timestamp, id): ``before`` continues to older
+    rows, ``after`` goes back to newer ones, and either way the query is
+    an index range scan of ``limit + 1`` rows however deep the page is.
+    Returns (rows, older_cursor, newer_cursor); a cursor is None when
+    there is nothing further in that direction.
+    """
+    conditions, params = [], []
+    if player_name is not None:
+        conditions.append("player_name = %s")
+        params.append(player_name)
+    position = decode_cursor(after) or decode_cursor(before)
+    newer = position is not None and decode_cursor(after) is not None
+    if position is not None:
+        conditions.append("(timestamp, id) > (%s, %s)" if newer else "(timestamp, id) < (%s, %s)")
+        params.extend(position)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ASC" if newer else "DESC"
+
+    with connection("score_history") as conn:
+        c = conn.cursor()
+        c.execute(
+            f"SELECT {_COLUMNS} FROM scores {where} "
+            f"ORDER BY timestamp {order}, id {order} LIMIT %s",
+            params + [limit + 1],
+        )
+        rows = c.fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        rows.reverse()
+        older_cursor = encode_cursor(rows[-1]) if rows else None
+        newer_cursor = encode_cursor(rows[0]) if more else None
+    else:
+        older_cursor = encode_cursor(rows[-1]) if more else None
+        newer_cursor = encode_cursor(rows[0]) if rows and position is not None else None
+    return rows, older_cursor, newer_cursor
+
+
+def player_bests(player_name):
+    """The player's best result on every sheet they have finished."""
+    with connection("player_bests") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT sheet_name, accuracy, final_time FROM best_scores "
+            "WHERE player_name = %s ORDER BY sheet_name",
+            (player_name,),
+        )
+        return c.fetchall()
@@ -0,0 +1,214 @@
+"""Stream vocabulary workbooks and CSV files into the sheets and nouns tables.
+
+Run with ``flask --app app import-vocab FILE...``. Rows are read one at a
+time and written in batches, so a file never has to fit in memory. Each
+sheet is upserted by name and each noun by (sheet, word): re-importing a
+file updates changed rows in place and leaves the others untouched.
+"""
+
+import csv
+import os
+
+from psycopg2.extras import execute_values
+
+from database import connection
+from vocab import ARTICLES
+
+# Workbook column -> field, in the order the nouns table and vocab rows use
+COLUMNS = ("Nomen", "Artikel", "Plural", "Übersetzung")
+# Optional CSV column naming the sheet, so one file can hold several units
+SHEET_COLUMN = "Wortschatz"
+IMPORT_BATCH = int(os.environ.get("VOCAB_IMPORT_BATCH", 1000))
+
+
+class SheetReport:
+    """What one import did to one sheet."""
+
+    def __init__(self, name, sheet_id, created):
+        self.name = name
+        self.sheet_id = sheet_id
+        self.created = created
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.errors = []  # (row number, message)
+        self.rows = {}  # word -> row number it was imported from
+
+    @property
+    def changed(self):
+        return self.created or self.inserted or self.updated or self.removed
+
+
+def _clean(value):
+    return "" if value is None else str(value).strip()
+
+
+def _header(path, sheet, names):
+    """Column positions for COLUMNS, or an error message naming the missing ones."""
+    col = {_clean(name): i for i, name in enumerate(names) if name is not None}
+    missing = [name for name in COLUMNS if name not in col]
+    if missing:
+        return None, f"{os.path.basename(path)} [{sheet}]: missing column(s) {', '.join(missing)}"
+    return [col[name] for name in COLUMNS], None
+
+
+def _read_workbook(path):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            columns, error = _header(path, ws.title, next(rows, ()))
+            if error:
+                yield ws.title, 1, None, error
+                continue
+            for line, row in enumerate(rows, start=2):
+                yield ws.title, line, tuple(row[i] if i < len(row) else None for i in columns), None
+    finally:
+        wb.close()
+
+
+def _read_csv(path):
+    default_sheet = os.path.splitext(os.path.basename(path))[0]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        rows = csv.reader(f, dialect)
+        header = next(rows, [])
+        columns, error = _header(path, default_sheet, header)
+        if error:
+            yield default_sheet, 1, None, error
+            return
+        names = [_clean(name) for name in header]
+        sheet_i = names.index(SHEET_COLUMN) if SHEET_COLUMN in names else None
+        for line, row in enumerate(rows, start=2):
+            sheet = _clean(row[sheet_i]) if sheet_i is not None and sheet_i < len(row) else ""
+            yield sheet or default_sheet, line, tuple(row[i] if i < len(row) else None for i in columns), None
+
+
+def read_rows(path):
+    """Yield (sheet, row number, (word, article, plural, meaning) or None, error) from a file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return _read_workbook(path)
+    if ext == ".csv":
+        return _read_csv(path)
+    raise ValueError(f"{path}: expected an .xlsx or .csv file")
+
+
+def validate(values):
+    """A cleaned (word, article, plural, meaning) row, or an error message.
+
+    Returns (row, None) or (None, message); (None, None) is a blank row.
+    """
+    word, article, plural, meaning = (_clean(v) for v in values)
+    if not (word or article or plural or meaning):
+        return None, None
+    if not word:
+        return None, "missing noun"
+    article = article.lower()
+    if article not in ARTICLES:
+        return None, f"article {article!r} is not one of {', '.join(ARTICLES)}"
+    if not plural:
+        return None, "missing plural (use '-' for none or same as singular)"
+    return (word, article, plural, meaning), None
+
+
+def _open_sheet(c, name, source):
+    c.execute("""
+        INSERT INTO sheets (name, position, source)
+        VALUES (%s, (SELECT COALESCE(MAX(position), 0) + 1 FROM sheets), %s)
+        ON CONFLICT (name) DO UPDATE SET source = EXCLUDED.source
+        RETURNING id, (xmax = 0)
+    """, (name, source))
+    sheet_id, created = c.fetchone()
+    return SheetReport(name, sheet_id, created)
+
+
+def _write_batch(c, batch, reports):
+    # Unchanged rows are skipped by the WHERE clause and come back empty
+    written = execute_values(c, """
+        INSERT INTO nouns (sheet_id, word, article, plural, meaning, position)
+        VALUES %s
+        ON CONFLICT (sheet_id, word) DO UPDATE
+        SET article = EXCLUDED.article, plural = EXCLUDED.plural,
+            meaning = EXCLUDED.meaning, position = EXCLUDED.position
+        WHERE (nouns.article, nouns.plural, nouns.meaning, nouns.position)
+            IS DISTINCT FROM (EXCLUDED.article, EXCLUDED.plural, EXCLUDED.meaning, EXCLUDED.position)
+        RETURNING sheet_id, (xmax = 0)
+    """, batch, page_size=len(batch), fetch=True)
+    by_id = {r.sheet_id: r for r in reports.values()}
+    for row in batch:
+        by_id[row[0]].unchanged += 1
+    for sheet_id, inserted in written:
+        report = by_id[sheet_id]
+        report.unchanged -= 1
+        if inserted:
+            report.inserted += 1
+        else:
+            report.updated += 1
+
+
+def import_file(path, prune=False, dry_run=False, batch_size=IMPORT_BATCH):
+    """Upsert every valid row of one file.
+
+    The file is imported in one transaction. Invalid rows and repeated
+    words are skipped and listed in the report's ``errors``. With
+    ``prune``, nouns a sheet no longer contains in this file are deleted,
+    unless some of that sheet's rows were rejected.
+    ``dry_run`` validates and counts everything, then rolls back.
+    Returns (a SheetReport per sheet the file names, file-level errors).
+    """
+    source = os.path.basename(path)
+    reports = {}
+    errors = []  # file-level problems, such as a sheet without the right columns
+    with connection("import_vocab") as conn:
+        c = conn.cursor()
+        batch = []
+        for sheet, line, values, error in read_rows(path):
+            if error:
+                errors.append(error)
+                continue
+            row, error = validate(values)
+            if row is None and error is None:
+                continue  # blank row
+            report = reports.get(sheet)
+            if report is None:
+                report = reports[sheet] = _open_sheet(c, sheet, source)
+            if error:
+                report.errors.append((line, error))
+                continue
+            if row[0] in report.rows:
+                report.errors.append((line, f"{row[0]!r} repeats row {report.rows[row[0]]}"))
+                continue
+            report.rows[row[0]] = line
+            batch.append((report.sheet_id,) + row + (len(report.rows),))
+            if len(batch) >= batch_size:
+                _write_batch(c, batch, reports)
+                batch = []
+        if batch:
+            _write_batch(c, batch, reports)
+
+        for report in reports.values():
+            if prune and not report.errors:
+                c.execute(
+                    "DELETE FROM nouns WHERE sheet_id = %s AND NOT (word = ANY(%s))",
+                    (report.sheet_id, list(report.rows)),
+                )
+                report.removed = c.rowcount
+            report.rows = {}
+        changed = [r.sheet_id for r in reports.values() if r.changed]
+        if changed:
+            # The stamp vocab.DatabaseProvider polls; clock_timestamp() rather
+            # than now() so a long import still moves it forward
+            c.execute(
+                "UPDATE sheets SET updated_at = clock_timestamp() WHERE id = ANY(%s)", (changed,)
+            )
+        if dry_run:
+            conn.rollback()
+    return list(reports.values()), errors
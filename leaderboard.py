@@ -0,0 +1,376 @@
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+
+import metrics
+from database import connection
+
+SHEET_LIMIT = 5
+GLOBAL_LIMIT = 10
+# Entries older than this are refetched, which also picks up scores saved
+# by other worker processes
+CACHE_TTL = float(os.environ.get("LEADERBOARD_TTL", 60))
+CACHE_MAX_SHEETS = int(os.environ.get("LEADERBOARD_MAX_SHEETS", 512))
+# How long the newest score ID is trusted before the database is asked again
+VERSION_TTL = float(os.environ.get("LEADERBOARD_VERSION_TTL", 1))
+# New scores looked at one by one when the version moves; past this many,
+# every cached leaderboard is dropped instead
+INVALIDATE_MAX_SCORES = 1000
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, fn):
+        """Replace a live entry with fn(entry); missing entries are left alone."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._data[key] = (fn(entry[0]), entry[1])
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_sheet_cache = TTLCache(CACHE_MAX_SHEETS, CACHE_TTL)
+_global_cache = TTLCache(1, CACHE_TTL)
+_version_cache = TTLCache(1, VERSION_TTL)
+_seen_score = None
+# Scores record_score has patched in and latest_score has not seen yet
+_own_scores = Counter()
+_own_lock = threading.Lock()
+
+
+def fetch_sheet_leaderboards(sheets, limit=SHEET_LIMIT):
+    """Return {sheet: [(player_name, final_time, accuracy), ...]} in one query.
+
+    Each sheet's top entries are read straight off best_scores_rank_idx.
+    """
+    leaderboards = {sheet: [] for sheet in sheets}
+    with connection("sheet_leaderboards") as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT s.sheet_name, b.player_name, b.final_time, b.accuracy
+            FROM unnest(%s::text[]) AS s(sheet_name)
+            CROSS JOIN LATERAL (
+                SELECT player_name, final_time, accuracy
+                FROM best_scores
+                WHERE best_scores.sheet_name = s.sheet_name
+                ORDER BY accuracy DESC, final_time ASC
+                LIMIT %s
+            ) AS b
+        """, (list(sheets), limit))
+        for sheet, name, final_time, accuracy in c.fetchall():
+            leaderboards[sheet].append((name, final_time, accuracy))
+    return leaderboards
+
+
+def fetch_top_scores(limit=GLOBAL_LIMIT):
+    with connection("top_scores") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT player_name, points, guesses, accuracy, timestamp FROM scores ORDER BY accuracy DESC LIMIT %s",
+            (limit,),
+        )
+        return c.fetchall()
+
+
+def latest_score():
+    """(id, timestamp) of the newest saved score, or None if there is none.
+
+    This is the version conditional GETs are validated against. When it
+    moves, the cached leaderboards of the sheets with new scores are
+    dropped, so pages never show data older than the version they are
+    tagged with; that also picks up scores saved by other workers without
+    waiting for CACHE_TTL. Scores this process already patched in through
+    record_score are skipped.
+    """
+    global _seen_score
+    latest = _version_cache.get("latest")
+    if latest is _MISSING:
+        with connection("latest_score") as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, timestamp FROM scores ORDER BY id DESC LIMIT 1")
+            latest = c.fetchone()
+        _version_cache.set("latest", latest)
+    if latest != _seen_score:
+        if (_seen_score is None or latest is None or latest[0] < _seen_score[0]
+                or latest[0] - _seen_score[0] > INVALIDATE_MAX_SCORES):
+            _sheet_cache.clear()
+            _global_cache.clear()
+        else:
+            _invalidate_since(_seen_score[0], latest[0])
+        _seen_score = latest
+    return latest
+
+
+def _score_key(sheet_name, player_name, accuracy, final_time):
+    return sheet_name, player_name, _real(accuracy), _real(final_time or 0)
+
+
+def _invalidate_since(after_id, latest_id):
+    """Drop the cached leaderboards that the scores after_id < id <= latest_id change."""
+    with connection("new_scores") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT sheet_name, player_name, accuracy, final_time FROM scores WHERE id > %s AND id <= %s",
+            (after_id, latest_id),
+        )
+        rows = c.fetchall()
+    foreign = False
+    with _own_lock:
+        for row in rows:
+            key = _score_key(*row)
+            if _own_scores[key]:
+                _own_scores[key] -= 1
+                if not _own_scores[key]:
+                    del _own_scores[key]
+                continue
+            foreign = True
+            _sheet_cache.invalidate(row[0])
+    if foreign:
+        _global_cache.clear()
+
+
+def sheet_leaderboards(sheets):
+    """Cached per-sheet top 5; only the sheets missing from the cache are queried."""
+    leaderboards = {}
+    missing = []
+    for sheet in sheets:
+        rows = _sheet_cache.get(sheet)
+        if rows is _MISSING:
+            missing.append(sheet)
+        else:
+            leaderboards[sheet] = rows
+    if missing:
+        for sheet, rows in fetch_sheet_leaderboards(missing).items():
+            _sheet_cache.set(sheet, rows)
+            leaderboards[sheet] = rows
+    return leaderboards
+
+
+def top_scores():
+    """Cached global top 10."""
+    rows = _global_cache.get("top")
+    if rows is _MISSING:
+        rows = fetch_top_scores()
+        _global_cache.set("top", rows)
+    return rows
+
+
+def record_score(player_name, sheet_name, points, guesses, accuracy, final_time, timestamp):
+    """Write-through: patch the cached leaderboards a newly saved score affects."""
+
+    def patch_sheet(rows):
+        previous = next((r for r in rows if r[0] == player_name), None)
+        if previous is not None:
+            if (accuracy, -final_time) <= (previous[2], -previous[1]):
+                return rows
+            rows = [r for r in rows if r is not previous]
+        rows = rows + [(player_name, final_time, accuracy)]
+        rows.sort(key=lambda r: (-r[2], r[1]))
+        return rows[:SHEET_LIMIT]
+
+    def patch_global(rows):
+        rows = list(rows) + [(player_name, points, guesses, accuracy, timestamp)]
+        rows.sort(key=lambda r: -r[3])
+        return rows[:GLOBAL_LIMIT]
+
+    _sheet_cache.update(sheet_name, patch_sheet)
+    _global_cache.update("top", patch_global)
+    with _own_lock:
+        if len(_own_scores) >= INVALIDATE_MAX_SCORES:
+            _own_scores.clear()  # scores that never reached the database
+        _own_scores[_score_key(sheet_name, player_name, accuracy, final_time)] += 1
+    # Only indexes already in memory; an unloaded one reads the score from
+    # the database when it is first asked for, so saving never waits on it
+    index = _ranks.get(sheet_name)
+    if index is not None:
+        with index.lock:
+            if index.seen_id is not None:
+                index.add(player_name, accuracy, final_time)
+
+
+def _real(value):
+    # best_scores stores REAL; round in-memory results the same way, so a
+    # score compares equal to itself once it has been read back
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+class RankIndex:
+    """One sheet's best result per player, kept in rank order.
+
+    ``_keys`` is a list sorted on (-accuracy, final_time, player), so a
+    player's rank is one bisect. A new best moves one entry, which is a
+    memmove of the list; at classroom sizes that is cheaper than any
+    balanced tree written in Python.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._best = {}  # player -> key
+        self.seen_id = None  # newest scores.id applied; None until loaded
+        self.lock = threading.Lock()
+
+    def add(self, player, accuracy, final_time):
+        """Apply one result; True if it is the player's new best."""
+        key = (-_real(accuracy), _real(final_time), player)
+        previous = self._best.get(player)
+        if previous is not None:
+            if previous <= key:
+                return False
+            del self._keys[bisect_left(self._keys, previous)]
+        insort(self._keys, key)
+        self._best[player] = key
+        return True
+
+    def rank(self, player):
+        """(rank, players, key) for the player's best, or None; ties share a rank."""
+        key = self._best.get(player)
+        if key is None:
+            return None
+        return bisect_left(self._keys, key[:2]) + 1, len(self._keys), key
+
+    def __len__(self):
+        return len(self._keys)
+
+
+_ranks = {}
+_ranks_lock = threading.Lock()
+
+
+def _load_ranks(index, sheet_name):
+    with connection("load_ranks") as conn:
+        c = conn.cursor()
+        # Scores committed between the two queries are applied twice,
+        # which add() ignores, rather than not at all
+        c.execute("SELECT coalesce(max(id), 0) FROM scores")
+        index.seen_id = c.fetchone()[0]
+        c.execute(
+            "SELECT player_name, accuracy, final_time FROM best_scores WHERE sheet_name = %s",
+            (sheet_name,),
+        )
+        for player, accuracy, final_time in c.fetchall():
+            index.add(player, accuracy, final_time)
+
+
+def _catch_up(index, sheet_name, latest_id):
+    """Apply scores saved up to latest_id since the index last looked, e.g. by other workers."""
+    with connection("catch_up_ranks") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT player_name, accuracy, coalesce(final_time, 0) FROM scores "
+            "WHERE id > %s AND id <= %s AND sheet_name = %s",
+            (index.seen_id, latest_id, sheet_name),
+        )
+        for player, accuracy, final_time in c.fetchall():
+            index.add(player, accuracy, final_time)
+    # Scores on other sheets count as seen too, or they would be asked for again
+    index.seen_id = latest_id
+
+
+def sheet_ranks(sheet_name):
+    """The sheet's RankIndex, read from best_scores the first time it is needed."""
+    with _ranks_lock:
+        index = _ranks.get(sheet_name)
+        if index is None:
+            index = _ranks[sheet_name] = RankIndex()
+    with index.lock:
+        if index.seen_id is None:
+            try:
+                _load_ranks(index, sheet_name)
+            except BaseException:
+                with _ranks_lock:
+                    _ranks.pop(sheet_name, None)
+                raise
+    return index
+
+
+def player_rank(sheet_name, player_name):
+    """{"rank", "players", "percentile", "accuracy", "final_time"}, or None if unranked.
+
+    percentile is the share of players with the same or a worse best.
+    """
+    index = sheet_ranks(sheet_name)
+    latest = latest_score()
+    with index.lock:
+        if latest is not None and latest[0] > index.seen_id:
+            _catch_up(index, sheet_name, latest[0])
+        found = index.rank(player_name)
+    if found is None:
+        return None
+    rank, players, key = found
+    return {
+        "rank": rank,
+        "players": players,
+        "percentile": round(100 * (players - rank + 1) / players, 1),
+        "accuracy": round(-key[0], 1),
+        "final_time": round(key[1], 2),
+    }
+
+
+def stats():
+    return {"sheets": _sheet_cache.stats(), "global": _global_cache.stats()}
+
+
+@metrics.REGISTRY.collector
+def _cache_metrics():
+    per_cache = stats()
+    return [
+        (name, kind, help, {(("cache", cache),): s[field] for cache, s in per_cache.items()})
+        for field, name, kind, help in (
+            ("size", "leaderboard_cache_entries", "gauge", "Cached leaderboards."),
+            ("hits", "leaderboard_cache_hits_total", "counter", "Leaderboard cache hits."),
+            ("misses", "leaderboard_cache_misses_total", "counter", "Leaderboard cache misses."),
+            ("evictions", "leaderboard_cache_evictions_total", "counter", "Leaderboard cache evictions."),
+        )
+    ] + [
+        ("leaderboard_rank_entries", "gauge", "Players held in the in-memory rank indexes.",
+         {(): sum(len(index) for index in list(_ranks.values()))}),
+    ]
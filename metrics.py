@@ -0,0 +1,195 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond guesses to slow workbook loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three adds."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for labels, (counts, count, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                extra = (("le", _number(float(bound))),)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, extra)} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+        return lines
+
+
+class Registry:
+    """Holds metrics plus collectors that report other modules' stats at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register fn() -> iterable of (name, kind, help, {label tuple: value})."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            for name, kind, help, values in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values.items():
+                    label_str = "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in labels) + "}" if labels else ""
+                    lines.append(f"{name}{label_str} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+request_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time spent handling a request.",
+    ("method", "endpoint", "status"),
+)
+db_seconds = REGISTRY.histogram(
+    "db_query_duration_seconds", "Time a pooled connection was held, per query site.",
+    ("query",),
+)
+db_wait_seconds = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time spent waiting to check out a pooled connection.",
+)
+vocab_load_seconds = REGISTRY.histogram(
+    "vocab_load_duration_seconds", "Time spent loading the vocabulary.",
+    ("source",),
+)
+vocab_reloads_total = REGISTRY.counter(
+    "vocab_reloads_total", "Background vocabulary reloads by outcome.", ("result",),
+)
+session_bytes = REGISTRY.histogram(
+    "session_size_bytes", "Size of pickled session data written to the store.",
+    buckets=BYTE_BUCKETS,
+)
+guesses_total = REGISTRY.counter(
+    "guesses_total", "Answers submitted.", ("game_type", "mode", "result"),
+)
+challenges_total = REGISTRY.counter(
+    "challenges_completed_total", "Challenges played to the end.", ("game_type",),
+)
+ratelimit_decisions_total = REGISTRY.counter(
+    "ratelimit_decisions_total", "Rate limiter decisions.", ("limiter", "result"),
+)
+admission_decisions_total = REGISTRY.counter(
+    "admission_decisions_total", "Requests admitted or shed by the concurrency cap.", ("result",),
+)
+race_broadcasts_total = REGISTRY.counter(
+    "race_broadcasts_total", "Diff events published to race rooms.",
+)
+race_events_sent_total = REGISTRY.counter(
+    "race_events_sent_total", "Race events written to subscribers.",
+)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,178 @@
+"""Versioned database schema, applied once with ``flask --app app migrate``."""
+
+from database import connection
+
+# Arbitrary key for the advisory lock that serialises concurrent migrate runs
+_LOCK_KEY = 0x5C0E5
+
+# (version, name, statements); never edit a released entry, append a new one.
+# The first steps use IF NOT EXISTS so databases created before migrations
+# existed are adopted as-is.
+MIGRATIONS = [
+    (1, "create scores", (
+        """
+        CREATE TABLE IF NOT EXISTS scores (
+            id SERIAL PRIMARY KEY,
+            player_name TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            guesses INTEGER NOT NULL,
+            accuracy REAL NOT NULL,
+            final_time REAL DEFAULT 0,
+            sheet_name TEXT,
+            timestamp TEXT NOT NULL
+        )
+        """,
+    )),
+    # Each player's best result per sheet, maintained by save_score
+    (2, "create best_scores", (
+        """
+        CREATE TABLE IF NOT EXISTS best_scores (
+            sheet_name TEXT NOT NULL,
+            player_name TEXT NOT NULL,
+            accuracy REAL NOT NULL,
+            final_time REAL NOT NULL,
+            score_id INTEGER NOT NULL,
+            PRIMARY KEY (sheet_name, player_name)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS best_scores_rank_idx
+        ON best_scores (sheet_name, accuracy DESC, final_time ASC)
+        """,
+        """
+        INSERT INTO best_scores (sheet_name, player_name, accuracy, final_time, score_id)
+        SELECT DISTINCT ON (sheet_name, player_name)
+            sheet_name, player_name, accuracy, COALESCE(final_time, 0), id
+        FROM scores
+        WHERE sheet_name IS NOT NULL
+        ORDER BY sheet_name, player_name, accuracy DESC, final_time ASC
+        ON CONFLICT (sheet_name, player_name) DO NOTHING
+        """,
+    )),
+    # Packed spaced-repetition state per player, sheet and game type (see scheduler.py)
+    (3, "create review_state", (
+        """
+        CREATE TABLE IF NOT EXISTS review_state (
+            player_name TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            game_type TEXT NOT NULL,
+            state BYTEA NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (player_name, sheet_name, game_type)
+        )
+        """,
+    )),
+    # Old rows hold datetime.now().isoformat() strings in the server's local
+    # time, so they are read in the session's TimeZone
+    (4, "scores timestamptz and history indexes", (
+        """
+        ALTER TABLE scores
+        ALTER COLUMN timestamp TYPE TIMESTAMPTZ USING timestamp::timestamptz
+        """,
+        # Keyset pagination of the global and per-player history (see history.py)
+        "CREATE INDEX IF NOT EXISTS scores_time_idx ON scores (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS scores_player_time_idx ON scores (player_name, timestamp, id)",
+        # Global top scores (leaderboard.fetch_top_scores)
+        "CREATE INDEX IF NOT EXISTS scores_accuracy_idx ON scores (accuracy DESC)",
+        "CREATE INDEX IF NOT EXISTS best_scores_player_idx ON best_scores (player_name)",
+    )),
+    # One row per answer, written in batches by events.py, plus the
+    # counters each batch is rolled up into
+    (5, "create guess_events and rollups", (
+        """
+        CREATE TABLE IF NOT EXISTS guess_events (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMPTZ NOT NULL,
+            player_name TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            game_type TEXT NOT NULL,
+            noun_index SMALLINT NOT NULL,
+            noun TEXT NOT NULL,
+            correct BOOLEAN NOT NULL,
+            latency_ms INTEGER NOT NULL
+        )
+        """,
+        # Events arrive in time order, so a BRIN index stays tiny
+        "CREATE INDEX IF NOT EXISTS guess_events_time_idx ON guess_events USING brin (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS noun_stats (
+            sheet_name TEXT NOT NULL,
+            game_type TEXT NOT NULL,
+            noun TEXT NOT NULL,
+            attempts BIGINT NOT NULL,
+            misses BIGINT NOT NULL,
+            latency_ms_total BIGINT NOT NULL,
+            PRIMARY KEY (sheet_name, game_type, noun)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS player_stats (
+            player_name TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            game_type TEXT NOT NULL,
+            attempts BIGINT NOT NULL,
+            correct BIGINT NOT NULL,
+            latency_ms_total BIGINT NOT NULL,
+            last_guess_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (player_name, sheet_name, game_type)
+        )
+        """,
+    )),
+    # Vocabulary imported with ``flask --app app import-vocab`` and served
+    # when VOCAB_SOURCE=database (see importer.py and vocab.py)
+    (6, "create sheets and nouns", (
+        """
+        CREATE TABLE IF NOT EXISTS sheets (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            position INTEGER NOT NULL,
+            source TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS sheets_position_idx ON sheets (position, id)",
+        # Re-imports update rows by word; position keeps the file's order
+        """
+        CREATE TABLE IF NOT EXISTS nouns (
+            sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+            word TEXT NOT NULL,
+            article TEXT NOT NULL,
+            plural TEXT NOT NULL,
+            meaning TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (sheet_id, word)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS nouns_position_idx ON nouns (sheet_id, position)",
+        # The change stamp vocab.DatabaseProvider polls
+        "CREATE INDEX IF NOT EXISTS sheets_updated_idx ON sheets (updated_at)",
+    )),
+]
+
+
+def migrate():
+    """Apply pending migrations in one transaction; returns the names applied."""
+    applied = []
+    with connection("migrate") as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = c.fetchone()[0]
+        for version, name, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for sql in statements:
+                c.execute(sql)
+            c.execute(
+                "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            applied.append(f"{version:03d} {name}")
+    return applied
@@ -0,0 +1,259 @@
+"""Classroom races: everyone plays the same deck and watches live standings.
+
+A teacher opens a room on one sheet; students join, and once the teacher
+starts it they all play a challenge with the same Deck seed. Every guess
+updates the player's row in the room in O(1). A single broadcaster thread
+per process turns whatever changed during the last TICK seconds into one
+diff event per room, serialised once and written as-is to every
+subscriber, so a room costs one event per tick per client however many
+guesses were made.
+
+Rooms live in the memory of the worker that created them, like the
+in-process session store: run a single worker, or route a room's
+requests to one, when races are used.
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Seconds between broadcasts; also the most a standing can lag behind
+TICK = float(os.environ.get("RACE_TICK", 0.5))
+# Seconds of silence before a comment is sent to keep proxies from timing out
+HEARTBEAT = 15
+# Diff events kept per room, so a client that reconnects can catch up
+EVENT_LOG = 64
+ROOM_MAX_PLAYERS = int(os.environ.get("RACE_MAX_PLAYERS", 200))
+# Rooms with no activity for this long are closed
+ROOM_TTL = 2 * 60 * 60
+# Letters without look-alikes, for codes read off a projector
+_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 5
+
+_rooms = {}
+_rooms_lock = threading.Lock()
+_broadcaster_pid = None
+
+
+class Room:
+    """One race: its settings, every player's progress and the event log."""
+
+    def __init__(self, code, host, sheet_name, game_type, vocab_version, noun_count):
+        self.code = code
+        self.host = host
+        self.sheet_name = sheet_name
+        self.game_type = game_type
+        self.vocab_version = vocab_version
+        self.noun_count = noun_count
+        self.seed = secrets.randbits(32)
+        self.status = "waiting"  # then "running", then "finished"
+        self.start_time = None
+        self.players = {}  # name -> [done, points, guesses, final_time or None]
+        self.touched = time.time()
+        self.subscribers = 0
+
+        self.seq = 0
+        self.events = deque(maxlen=EVENT_LOG)  # (seq, encoded event)
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._status_changed = False
+        self._standings = []
+
+    # Updates, called from request handlers
+
+    def join(self, name):
+        with self._cond:
+            if name not in self.players:
+                if self.status != "waiting" or len(self.players) >= ROOM_MAX_PLAYERS:
+                    return False
+                self.players[name] = [0, 0, 0, None]
+                self._dirty.add(name)
+            self.touched = time.time()
+            return True
+
+    def start(self):
+        with self._cond:
+            if self.status != "waiting":
+                return False
+            self.status = "running"
+            self.start_time = time.time()
+            self._status_changed = True
+            self.touched = self.start_time
+            return True
+
+    def finish(self):
+        with self._cond:
+            if self.status == "finished":
+                return
+            self.status = "finished"
+            self._status_changed = True
+
+    def record(self, name, done, points, guesses, final_time=None):
+        with self._cond:
+            row = self.players.get(name)
+            if row is None or row[3] is not None:
+                return
+            row[:] = [done, points, guesses, final_time]
+            self._dirty.add(name)
+            self.touched = time.time()
+            if final_time is not None and all(r[3] is not None for r in self.players.values()):
+                self.status = "finished"
+                self._status_changed = True
+
+    # Broadcasting
+
+    def _row(self, name):
+        done, points, guesses, final_time = self.players[name]
+        return {"done": done, "points": points, "guesses": guesses, "final_time": final_time}
+
+    def _rank(self):
+        # Finished players by time, then everyone else by progress
+        def key(name):
+            done, points, guesses, final_time = self.players[name]
+            if final_time is not None:
+                return (0, final_time, -points, name)
+            return (1, -done, -points, name)
+
+        return sorted(self.players, key=key)
+
+    def snapshot(self):
+        """The whole room as one (seq, event), for a subscriber that has nothing yet."""
+        with self._cond:
+            return self.seq, _encode(self.seq, "snapshot", {
+                "status": self.status,
+                "sheet": self.sheet_name,
+                "game_type": self.game_type,
+                "noun_count": self.noun_count,
+                "start_time": self.start_time,
+                "players": {name: self._row(name) for name in self.players},
+                "standings": self._rank(),
+            })
+
+    def flush(self):
+        """Publish what changed since the last tick as one diff; True if anything did."""
+        with self._cond:
+            if not self._dirty and not self._status_changed:
+                return False
+            diff = {"players": {name: self._row(name) for name in self._dirty}}
+            standings = self._rank()
+            if standings != self._standings:
+                diff["standings"] = self._standings = standings
+            if self._status_changed:
+                diff["status"] = self.status
+                diff["start_time"] = self.start_time
+            self._dirty = set()
+            self._status_changed = False
+            self.seq += 1
+            self.events.append((self.seq, _encode(self.seq, "diff", diff)))
+            self._cond.notify_all()
+            return True
+
+    def close(self):
+        with self._cond:
+            self.status = "closed"
+            self._cond.notify_all()
+
+    def wait(self, after, timeout):
+        """(seq, event) pairs after ``after``; [] on timeout, None if the log does not cover it."""
+        with self._cond:
+            if after > self.seq:
+                return None  # an id from another room or process
+            self._cond.wait_for(lambda: self.seq > after or self.status == "closed", timeout)
+            if self.seq <= after:
+                return []
+            if not self.events or self.events[0][0] > after + 1:
+                return None
+            return [event for event in self.events if event[0] > after]
+
+
+def _encode(seq, kind, payload):
+    data = json.dumps(payload, separators=(",", ":"))
+    return f"id: {seq}\nevent: {kind}\ndata: {data}\n\n".encode("utf-8")
+
+
+def create(host, sheet_name, game_type, vocab_version, noun_count):
+    with _rooms_lock:
+        while True:
+            code = "".join(secrets.choice(_CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            if code not in _rooms:
+                break
+        room = _rooms[code] = Room(code, host, sheet_name, game_type, vocab_version, noun_count)
+    _ensure_broadcaster()
+    return room
+
+
+def get(code):
+    return _rooms.get((code or "").upper())
+
+
+def _ensure_broadcaster():
+    global _broadcaster_pid
+    if _broadcaster_pid != os.getpid():
+        with _rooms_lock:
+            if _broadcaster_pid != os.getpid():
+                _broadcaster_pid = os.getpid()
+                threading.Thread(target=_broadcast, name="race-broadcaster", daemon=True).start()
+
+
+def _broadcast():
+    pid = os.getpid()
+    while _broadcaster_pid == pid:
+        time.sleep(TICK)
+        now = time.time()
+        for room in list(_rooms.values()):
+            try:
+                if room.flush():
+                    metrics.race_broadcasts_total.inc()
+                if now - room.touched > ROOM_TTL:
+                    room.close()
+                    with _rooms_lock:
+                        _rooms.pop(room.code, None)
+            except Exception:
+                log.exception("race room %s broadcast failed", room.code)
+
+
+def stream(room, last_event_id=None):
+    """Yield the server-sent event stream for one subscriber.
+
+    A client reconnecting with Last-Event-ID gets the diffs it missed, or
+    a fresh snapshot once those have left the log.
+    """
+    with room._cond:
+        room.subscribers += 1
+    try:
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        pending = None if after is None else room.wait(after, 0)
+        # Tells EventSource how long to wait before reconnecting
+        yield b"retry: 2000\n\n"
+        while True:
+            if pending is None:
+                pending = [room.snapshot()]
+            elif not pending:
+                yield b": keep-alive\n\n"
+            for after, data in pending:
+                yield data
+            metrics.race_events_sent_total.inc(amount=len(pending))
+            if room.status == "closed":
+                return
+            pending = room.wait(after, HEARTBEAT)
+    finally:
+        with room._cond:
+            room.subscribers -= 1
+
+
+@metrics.REGISTRY.collector
+def _race_metrics():
+    rooms = list(_rooms.values())
+    return [
+        ("race_rooms", "gauge", "Open race rooms.", {(): len(rooms)}),
+        ("race_subscribers", "gauge", "Clients streaming race events.",
+         {(): sum(r.subscribers for r in rooms)}),
+    ]
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class BucketStore:
+    """Backend interface: token buckets by key.
+
+    take() refills the bucket at ``rate`` tokens per second up to
+    ``burst``, then removes one token if there is one. It returns 0 when
+    the token was taken, or the seconds until one will be available.
+    """
+
+    def take(self, key, rate, burst, now):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+def _refill(tokens, updated, rate, burst, now):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBucketStore(BucketStore):
+    """In-process buckets, dropping the least recently used first.
+
+    Each worker process counts separately, so with N workers a key gets
+    up to N times the rate.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                while len(self._buckets) > self.max_entries:
+                    self._buckets.popitem(last=False)  # forgotten buckets start full again
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0], wait = _refill(bucket[0], bucket[1], rate, burst, now)
+            bucket[1] = now
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteBucketStore(BucketStore):
+    """File-backed buckets shared by every worker on the same host."""
+
+    # Buckets idle long enough to be full again are purged on roughly one
+    # take in PURGE_EVERY
+    PURGE_EVERY = 1000
+
+    def __init__(self, path="ratelimit.db"):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit, so BEGIN IMMEDIATE below controls the transaction
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._conn()
+        # Take the write lock first, so concurrent workers cannot both
+        # spend the same token
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = _refill(*(row or (burst, now)), rate, burst, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            self._takes += 1
+            if self._takes % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - burst / rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM buckets").fetchone()[0]
+
+
+def store_from_env():
+    """Build the bucket store selected by RATE_LIMIT_BACKEND (memory or sqlite)."""
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryBucketStore(int(os.environ.get("RATE_LIMIT_MAX_ENTRIES", 100_000)))
+    if backend == "sqlite":
+        return SqliteBucketStore(os.environ.get("RATE_LIMIT_FILE", "ratelimit.db"))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+class RateLimiter:
+    """A named token-bucket limit: ``rate`` requests per second, bursts of up to ``burst``."""
+
+    def __init__(self, name, store, rate, burst):
+        self.name = name
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+
+    def check(self, key):
+        """0 if the request may go ahead, else the seconds to wait before retrying."""
+        wait = self.store.take(key, self.rate, self.burst, time.time())
+        metrics.ratelimit_decisions_total.inc(self.name, "limited" if wait else "allowed")
+        return wait
+
+
+class Admission:
+    """Caps the requests a process works on at once.
+
+    A request waits up to ``wait`` seconds for a slot, then is shed, so a
+    burst beyond capacity gets a cheap refusal instead of queueing behind
+    database calls and timing out anyway.
+    """
+
+    def __init__(self, limit, wait=0.0):
+        self.limit = limit
+        self.wait = wait
+        self.inflight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def enter(self):
+        admitted = self._slots.acquire(timeout=self.wait) if self.wait > 0 else self._slots.acquire(blocking=False)
+        metrics.admission_decisions_total.inc("admitted" if admitted else "shed")
+        if admitted:
+            with self._lock:
+                self.inflight += 1
+        return admitted
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+        self._slots.release()
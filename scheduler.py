@@ -0,0 +1,248 @@
+import base64
+import heapq
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+from database import connection
+from writebehind import BatchWriter
+
+# Relearning step after a miss, then the first two successful intervals
+RELEARN_INTERVAL = 30
+FIRST_INTERVAL = 10 * 60
+SECOND_INTERVAL = 24 * 60 * 60
+
+MIN_EASE = 130  # ease factors are stored in hundredths
+DEFAULT_EASE = 250
+
+STATE_VERSION = 1
+_HEADER = struct.Struct("<BI")
+
+CACHE_MAX = int(os.environ.get("REVIEW_CACHE_MAX", 1000))
+# Seconds a cached queue is used before grades saved by other workers are
+# merged into it
+CACHE_TTL = float(os.environ.get("REVIEW_CACHE_TTL", 30))
+
+
+class ReviewQueue:
+    """SM-2 style review state for one player on one sheet and game type.
+
+    Per noun it keeps the due time, current interval, ease and repetition
+    count in parallel arrays, plus a heap of (due, tiebreak, version, index)
+    used to pick the most overdue noun. Grading pushes a fresh heap entry and
+    bumps the noun's version so the old entry is skipped lazily, so both
+    operations are O(log n).
+    """
+
+    def __init__(self, size, due=None, interval=None, ease=None, reps=None):
+        self.key = None  # (player_name, sheet_name, game_type) once registered
+        self.loaded = time.monotonic()
+        self.size = size
+        self.due = due or [0] * size
+        self.interval = interval or [0] * size
+        self.ease = ease or [DEFAULT_EASE] * size
+        self.reps = reps or [0] * size
+        self._rebuild()
+
+    def _rebuild(self):
+        self._version = [0] * self.size
+        self._heap = [(self.due[i], random.random(), 0, i) for i in range(self.size)]
+        heapq.heapify(self._heap)
+
+    def _top(self):
+        heap = self._heap
+        while heap[0][2] != self._version[heap[0][3]]:
+            heapq.heappop(heap)  # superseded by a later grade
+        return heap[0]
+
+    def next(self, exclude=None):
+        """Index of the noun due soonest (the most overdue one first).
+
+        ``exclude`` skips the noun just answered, so a miss is not asked
+        again straight away unless it is the only noun.
+        """
+        entry = self._top()
+        if entry[3] != exclude or self.size == 1:
+            return entry[3]
+        heapq.heappop(self._heap)
+        index = self._top()[3]
+        heapq.heappush(self._heap, entry)
+        return index
+
+    def upcoming(self, n, current=None):
+        """Best guess at the next ``n`` nouns, assuming each is answered correctly.
+
+        A correct answer pushes a noun at least FIRST_INTERVAL into the
+        future, so this is the heap order without ``current``; misses and
+        nouns coming due change it.
+        """
+        live = (e for e in self._heap if e[2] == self._version[e[3]] and e[3] != current)
+        return [e[3] for e in heapq.nsmallest(n, live)]
+
+    def grade(self, index, correct, now=None):
+        now = int(time.time()) if now is None else int(now)
+        # Map the binary answer onto SM-2 quality: 4 for a hit, 1 for a miss
+        quality = 4 if correct else 1
+        if correct:
+            self.reps[index] = min(self.reps[index] + 1, 255)
+            if self.reps[index] == 1:
+                interval = FIRST_INTERVAL
+            elif self.reps[index] == 2:
+                interval = SECOND_INTERVAL
+            else:
+                interval = self.interval[index] * self.ease[index] // 100
+        else:
+            self.reps[index] = 0
+            interval = RELEARN_INTERVAL
+        delta = 10 - (5 - quality) * (8 + (5 - quality) * 2)
+        self.ease[index] = max(MIN_EASE, self.ease[index] + delta)
+        self.interval[index] = min(interval, 0xFFFFFFFF)
+        self.due[index] = min(now + interval, 0xFFFFFFFF)
+        self._version[index] += 1
+        heapq.heappush(self._heap, (self.due[index], random.random(), self._version[index], index))
+        # Keep stale entries from piling up over a long session
+        if len(self._heap) > 2 * self.size:
+            self._rebuild()
+
+    def merge(self, other):
+        """Take each noun's state from ``other`` where it was graded more recently.
+
+        A noun was last graded at due - interval, so answers given on
+        different workers combine instead of one state replacing the other.
+        """
+        changed = False
+        for i in range(min(self.size, other.size)):
+            if other.due[i] - other.interval[i] > self.due[i] - self.interval[i]:
+                self.due[i] = other.due[i]
+                self.interval[i] = other.interval[i]
+                self.ease[i] = other.ease[i]
+                self.reps[i] = other.reps[i]
+                changed = True
+        if changed:
+            self._rebuild()
+
+    def to_bytes(self):
+        n = self.size
+        return b"".join((
+            _HEADER.pack(STATE_VERSION, n),
+            struct.pack(f"<{n}I", *self.due),
+            struct.pack(f"<{n}I", *self.interval),
+            struct.pack(f"<{n}H", *self.ease),
+            struct.pack(f"<{n}B", *self.reps),
+        ))
+
+    @classmethod
+    def from_bytes(cls, size, data):
+        """Load packed state; nouns added to or removed from the sheet are reconciled."""
+        version, n = _HEADER.unpack_from(data)
+        if version != STATE_VERSION:
+            return cls(size)
+        offset = _HEADER.size
+        arrays = []
+        for fmt, width in (("I", 4), ("I", 4), ("H", 2), ("B", 1)):
+            arrays.append(list(struct.unpack_from(f"<{n}{fmt}", data, offset)))
+            offset += n * width
+        due, interval, ease, reps = arrays
+        if n < size:
+            missing = size - n
+            due += [0] * missing
+            interval += [0] * missing
+            ease += [DEFAULT_EASE] * missing
+            reps += [0] * missing
+        return cls(size, due[:size], interval[:size], ease[:size], reps[:size])
+
+
+def _flush_states(records):
+    # Only the latest state per key in the batch matters
+    latest = {}
+    for r in records:
+        latest[tuple(r["key"])] = base64.b64decode(r["state"])
+    with connection("save_reviews") as conn:
+        c = conn.cursor()
+        # Other workers save the same rows: lock them and merge, so neither
+        # side's answers are overwritten
+        c.execute("""
+            SELECT player_name, sheet_name, game_type, state FROM review_state
+            WHERE (player_name, sheet_name, game_type) IN %s
+            ORDER BY player_name, sheet_name, game_type
+            FOR UPDATE
+        """, (tuple(latest),))
+        for player_name, sheet_name, game_type, stored in c.fetchall():
+            key = (player_name, sheet_name, game_type)
+            queue = ReviewQueue.from_bytes(_HEADER.unpack_from(latest[key])[1], latest[key])
+            queue.merge(ReviewQueue.from_bytes(queue.size, bytes(stored)))
+            latest[key] = queue.to_bytes()
+        execute_values(c, """
+            INSERT INTO review_state (player_name, sheet_name, game_type, state)
+            VALUES %s
+            ON CONFLICT (player_name, sheet_name, game_type) DO UPDATE
+            SET state = EXCLUDED.state, updated_at = now()
+        """, [key + (state,) for key, state in latest.items()])
+
+
+_writer = BatchWriter(
+    "reviews",
+    _flush_states,
+    batch_size=int(os.environ.get("REVIEW_FLUSH_SIZE", 100)),
+    interval=float(os.environ.get("REVIEW_FLUSH_INTERVAL", 2.0)),
+    spill_dir=os.environ.get("REVIEW_SPILL_DIR"),
+)
+
+_queues = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load_queue(key, size):
+    with connection("load_reviews") as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT state FROM review_state WHERE player_name = %s AND sheet_name = %s AND game_type = %s",
+            key,
+        )
+        row = c.fetchone()
+    return ReviewQueue.from_bytes(size, bytes(row[0])) if row else ReviewQueue(size)
+
+
+def get_queue(player_name, sheet_name, game_type, size):
+    """Review queue for a player's sheet, cached per process.
+
+    A cached queue older than CACHE_TTL has the saved state merged in
+    again, which picks up answers the player gave on other workers.
+    """
+    key = (player_name, sheet_name, game_type)
+    with _lock:
+        queue = _queues.get(key)
+        if queue is not None and queue.size == size:
+            _queues.move_to_end(key)
+            if time.monotonic() - queue.loaded < CACHE_TTL:
+                return queue
+        else:
+            queue = None
+
+    if queue is not None:
+        queue.merge(_load_queue(key, size))
+        queue.loaded = time.monotonic()
+        return queue
+    queue = _load_queue(key, size)
+    queue.key = key
+
+    with _lock:
+        _queues[key] = queue
+        _queues.move_to_end(key)
+        while len(_queues) > CACHE_MAX:
+            _queues.popitem(last=False)
+    return queue
+
+
+def record_answer(queue, index, correct):
+    """Grade an answer and queue the updated state to be persisted."""
+    queue.grade(index, correct)
+    _writer.submit({
+        "key": queue.key,
+        "state": base64.b64encode(queue.to_bytes()).decode("ascii"),
+    })
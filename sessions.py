@@ -0,0 +1,199 @@
+import os
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import metrics
+
+
+class SessionStore:
+    """Backend interface: maps a session ID to the pickled session dict."""
+
+    def get(self, sid):
+        raise NotImplementedError
+
+    def set(self, sid, data, ttl):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LRUSessionStore(SessionStore):
+    """In-process store, evicting the least recently used sessions first.
+
+    Only suitable for a single worker process.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._data[sid] = (data, time.time() + ttl)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteSessionStore(SessionStore):
+    """File-backed store shared by every worker on the same host."""
+
+    # Expired rows are purged on roughly one write in PURGE_EVERY
+    PURGE_EVERY = 500
+
+    def __init__(self, path="sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, sid, data, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, data, now + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute(
+            "SELECT count(*) FROM sessions WHERE expires >= ?", (time.time(),)
+        ).fetchone()[0]
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in a SessionStore; the cookie only holds the ID."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _new_session(self):
+        return ServerSideSession(sid=secrets.token_urlsafe(24), new=True)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return self._new_session()
+        data = self.store.get(sid)
+        if data is None:
+            return self._new_session()
+        try:
+            return ServerSideSession(pickle.loads(data), sid=sid)
+        except (pickle.UnpicklingError, EOFError, AttributeError):
+            return self._new_session()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        data = pickle.dumps(dict(session), protocol=pickle.HIGHEST_PROTOCOL)
+        metrics.session_bytes.observe(len(data))
+        self.store.set(session.sid, data, ttl)
+        if session.new or session.permanent:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def store_from_env():
+    """Build the session store selected by SESSION_BACKEND (memory or sqlite)."""
+    backend = os.environ.get("SESSION_BACKEND", "memory")
+    if backend == "memory":
+        return LRUSessionStore(int(os.environ.get("SESSION_MAX_ENTRIES", 10_000)))
+    if backend == "sqlite":
+        return SqliteSessionStore(os.environ.get("SESSION_FILE", "sessions.db"))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
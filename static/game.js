@@ -0,0 +1,137 @@
+// Plays the game through the JSON API instead of reloading the page per guess.
+// Upcoming nouns are prefetched and shown as soon as a guess is made; the
+// server still grades every answer and its reply corrects any misprediction.
+// Without fetch() the plain HTML form keeps working.
+(function () {
+    const game = document.getElementById('game');
+    if (!game || !window.fetch) {
+        return;
+    }
+    const word = game.querySelector('.noun-word');
+    const feedback = game.querySelector('.feedback');
+    const form = game.querySelector('form');
+    const input = form.querySelector('input.plural');
+    const buttons = form.querySelectorAll('button');
+
+    const PREFETCH = 10;
+    const LOW_WATER = 3;
+
+    let shown = {index: parseInt(game.dataset.index, 10), word: word.textContent};
+    let upcoming = [];
+    let generation = 0;       // bumped whenever the client's predictions are dropped
+    let chain = Promise.resolve();  // guesses go to the server one at a time, in order
+
+    function show(noun) {
+        shown = noun;
+        word.textContent = noun ? noun.word : '';
+        buttons.forEach(function (b) { b.disabled = !noun; });
+    }
+
+    // Adopt the server's prediction of what follows `after`, if it reaches
+    // further than what we already hold
+    function merge(after, list) {
+        const seq = [after].concat(list || []);
+        const k = shown ? seq.findIndex(function (n) { return n.index === shown.index; }) : -1;
+        if (k >= 0 && seq.length - k - 1 > upcoming.length) {
+            upcoming = seq.slice(k + 1);
+        }
+    }
+
+    function resync(state) {
+        generation += 1;
+        upcoming = [];
+        show(state.current || state.next);
+        merge(shown, state.upcoming);
+    }
+
+    function request(method, path, body) {
+        return fetch(path, {
+            method: method,
+            credentials: 'same-origin',
+            headers: body ? {'Content-Type': 'application/json'} : {},
+            body: body ? JSON.stringify(body) : undefined,
+        }).then(function (r) {
+            return r.json().then(function (data) { return {status: r.status, data: data}; });
+        });
+    }
+
+    function fail() {
+        window.location.reload();  // the server's session is the source of truth
+    }
+
+    function guess(answer) {
+        const noun = shown;
+        const gen = generation;
+        const expected = upcoming.length ? upcoming.shift() : null;
+        show(expected);
+
+        chain = chain.then(function () {
+            if (gen !== generation) {
+                return;  // answered a noun the server never asked
+            }
+            return request('POST', '/api/game/guess', {
+                index: noun.index,
+                guess: answer,
+                prefetch: upcoming.length < LOW_WATER ? PREFETCH : 0,
+            }).then(function (res) {
+                const data = res.data;
+                if (res.status === 409) {
+                    resync(data);
+                    return;
+                }
+                if (res.status === 429) {
+                    // Not counted: show the server's current noun again once allowed
+                    generation += 1;
+                    return new Promise(function (resolve) {
+                        setTimeout(resolve, Math.max(1, data.retry_after || 1) * 1000);
+                    }).then(function () {
+                        return request('GET', '/api/game/nouns?n=' + PREFETCH);
+                    }).then(function (res) {
+                        if (res.status !== 200) {
+                            fail();
+                            return;
+                        }
+                        resync(res.data);
+                    });
+                }
+                if (res.status !== 200) {
+                    fail();
+                    return;
+                }
+                feedback.innerHTML = data.feedback;
+                if (data.done) {
+                    window.location.href = data.redirect;
+                    return;
+                }
+                if (!expected || expected.index !== data.next.index) {
+                    resync(data);
+                } else {
+                    merge(data.next, data.upcoming);
+                }
+            });
+        }).catch(fail);
+    }
+
+    form.addEventListener('submit', function (event) {
+        let answer;
+        if (input) {
+            answer = input.value;
+            input.value = '';
+            input.focus();
+        } else if (event.submitter) {
+            answer = event.submitter.value;
+        } else {
+            return;  // no way to tell which button was pressed: plain POST
+        }
+        event.preventDefault();
+        if (shown) {
+            guess(answer);
+        }
+    });
+
+    request('GET', '/api/game/nouns?n=' + PREFETCH).then(function (res) {
+        if (res.status === 200 && shown && res.data.current.index === shown.index) {
+            merge(res.data.current, res.data.upcoming);
+        }
+    }).catch(function () {});
+})();
@@ -0,0 +1,76 @@
+// Live race standings over server-sent events. The server sends one
+// snapshot, then at most one diff per tick holding only the players that
+// changed; the standings order is only sent when it changed.
+(function () {
+    const box = document.getElementById('race');
+    if (!box || !window.EventSource) {
+        return;
+    }
+    const list = box.querySelector('.standings');
+    const statusLine = box.querySelector('.race-status');
+    const me = box.dataset.player;
+    const limit = parseInt(box.dataset.limit || '0', 10);
+    const STATUS = {waiting: 'Warten auf den Start …', running: 'Läuft!', finished: 'Beendet.'};
+
+    let state = null;
+
+    function line(name, row) {
+        if (row.final_time !== null) {
+            return name + ' – 🏁 ' + row.final_time + 's';
+        }
+        return name + ' – ' + row.done + '/' + state.noun_count;
+    }
+
+    function render() {
+        const names = limit ? state.standings.slice(0, limit) : state.standings;
+        list.replaceChildren.apply(list, names.map(function (name) {
+            const li = document.createElement('li');
+            li.textContent = line(name, state.players[name]);
+            if (name === me) {
+                li.className = 'me';
+            }
+            return li;
+        }));
+        if (statusLine) {
+            statusLine.textContent = STATUS[state.status] || '';
+        }
+    }
+
+    // Students in the room go to the game when it starts; players leave
+    // the game for the standings when the teacher ends the race
+    function follow() {
+        const mine = state.players[me];
+        if (box.dataset.page === 'room' && box.dataset.joined === '1' && state.status === 'running'
+                && mine && mine.final_time === null) {
+            window.location.href = '/';
+        } else if (box.dataset.page === 'game' && state.status === 'finished') {
+            window.location.href = box.dataset.room;
+        } else if (box.dataset.page === 'room' && state.status !== 'waiting'
+                && document.querySelector('form[action$="/start"], form[action$="/join"]')) {
+            window.location.reload();  // drop the buttons that no longer apply
+        }
+    }
+
+    const source = new EventSource(box.dataset.events);
+    source.addEventListener('snapshot', function (event) {
+        state = JSON.parse(event.data);
+        render();
+        follow();
+    });
+    source.addEventListener('diff', function (event) {
+        if (!state) {
+            return;
+        }
+        const diff = JSON.parse(event.data);
+        Object.assign(state.players, diff.players);
+        if (diff.standings) {
+            state.standings = diff.standings;
+        }
+        if (diff.status) {
+            state.status = diff.status;
+            state.start_time = diff.start_time;
+        }
+        render();
+        follow();
+    });
+})();
@@ -0,0 +1,18 @@
+(function () {
+    const timer = document.getElementById('timer');
+    if (!timer) {
+        return;
+    }
+    const startTime = parseFloat(timer.dataset.start);
+
+    function updateTimer() {
+        let elapsed = Math.floor(Date.now()/1000 - startTime);
+        let hours = Math.floor(elapsed / 3600).toString().padStart(2,'0');
+        let minutes = Math.floor((elapsed % 3600)/60).toString().padStart(2,'0');
+        let seconds = (elapsed % 60).toString().padStart(2,'0');
+        timer.textContent = `⏱️ ${hours}:${minutes}:${seconds}`;
+    }
+
+    setInterval(updateTimer, 1000);
+    updateTimer();
+})();
@@ -0,0 +1,29 @@
+import pytest
+
+from gameLogic import Noun, PluralAnswers
+
+
+@pytest.mark.parametrize("word, plural, guess, expected", [
+    ("Haus", "Häuser", "Häuser", "exact"),
+    ("Haus", "Häuser", "die Häuser", "exact"),
+    ("Haus", "Häuser", "Haeuser", "folded"),
+    ("Haus", "Häuser", "Hauser", None),
+    ("Haus", "Häuser", "die Hauser", None),
+    ("Land", "Länder", "Lander", None),
+    ("Mutter", "Mütter", "Mutter", None),
+    ("Computer", "Computer", "Conputer", "typo"),
+    ("Schrank", "Schränke", "Schränken", None),
+    ("Pizza", "Pizzas / Pizzen", "Pizzen", "exact"),
+    ("Koffer", "-", "Koffer", "exact"),
+    ("Koffer", "-", "die Koffer", "exact"),
+    ("Koffer", "-", "-", "exact"),
+    ("Koffer", "-", "kein Plural", None),
+    ("Koffer", "-", "nur Singular", None),
+    ("Obst", "-----", "-----", "exact"),
+    ("Obst", "-----", "-", "exact"),
+    ("Obst", "-----", "kein Plural", "exact"),
+    ("Obst", "-----", "nur Singular", "exact"),
+    ("Obst", "-----", "Obst", None),
+])
+def test_match(word, plural, guess, expected):
+    assert PluralAnswers(Noun(word, 0, plural, "")).match(guess) == expected
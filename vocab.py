@@ -0,0 +1,446 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import metrics
+
+EXCEL_FILE = "AlleLernwortschatze.xlsx"
+CACHE_FILE = os.environ.get("VOCAB_CACHE_FILE", ".vocab_cache.bin")
+CACHE_FORMAT = 3
+
+# Compiled store layout (little-endian): header, sheet table, fixed-width
+# noun records, then one table of UTF-8 strings that the records point into
+_MAGIC = b"VOCB"
+_HEADER = struct.Struct("<4sHHd32sIIQ")  # magic, format, unused, mtime, sha256, sheets, nouns, strings offset
+_SHEET = struct.Struct("<IIII")  # name offset, name length, first noun, noun count
+_NOUN = struct.Struct("<IHIHIHB")  # offset and length of word, plural, meaning; article code
+# Seconds between checks of the workbook's mtime; 0 disables reloading
+WATCH_INTERVAL = float(os.environ.get("VOCAB_WATCH_INTERVAL", 2))
+# Older snapshots kept for games started before a reload
+KEEP_VERSIONS = int(os.environ.get("VOCAB_KEEP_VERSIONS", 8))
+# Where the vocabulary comes from: "excel" (the workbook) or "database"
+# (the tables filled by ``flask --app app import-vocab``)
+VOCAB_SOURCE = os.environ.get("VOCAB_SOURCE", "excel")
+# Rows per round trip when streaming the nouns table
+DB_FETCH_SIZE = 2000
+
+# Articles are stored as one-byte codes; anything else becomes NO_ARTICLE
+ARTICLES = ("der", "die", "das")
+NO_ARTICLE = len(ARTICLES)
+ARTICLE_CODES = {article: code for code, article in enumerate(ARTICLES)}
+_ARTICLE_NAMES = ARTICLES + ("",)
+
+log = logging.getLogger(__name__)
+
+
+class Vocabulary:
+    """Every sheet of the vocabulary, loaded once.
+
+    ``sheets`` maps sheet name -> list of (word, article, plural, meaning)
+    tuples, in the order the sheets appear in the source. Articles are
+    lower case and missing cells are empty strings. Sheet data is
+    never modified once built; ``version`` identifies it. ``mtime`` is the
+    source's change stamp when it was loaded.
+    """
+
+    def __init__(self, mtime, digest, sheets):
+        self.mtime = mtime
+        self.digest = digest
+        self.version = digest[:16]
+        self.sheets = sheets
+        self.sheet_names = list(sheets)
+        self.noun_cache = {}  # objects gameLogic derives from the sheets
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cell_str(value):
+    return "" if value is None else str(value).strip()
+
+
+def article_code(article):
+    return ARTICLE_CODES.get(article.strip().lower(), NO_ARTICLE)
+
+
+def _parse_workbook(path):
+    """Stream every sheet with openpyxl's read-only reader."""
+    # Imported here: only needed when the compiled cache is stale
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, ())
+            col = {name: i for i, name in enumerate(header) if name is not None}
+            word_i, article_i = col["Nomen"], col["Artikel"]
+            plural_i, meaning_i = col["Plural"], col["Übersetzung"]
+            nouns = []
+            for line, row in enumerate(rows, start=2):
+                if row[word_i] is None and row[article_i] is None:
+                    continue  # blank row
+                article = _cell_str(row[article_i]).lower()
+                if article not in ARTICLE_CODES:
+                    log.warning("%s [%s] row %d: unknown article %r", path, ws.title, line, article)
+                    article = ""
+                nouns.append((
+                    _cell_str(row[word_i]),
+                    article,
+                    _cell_str(row[plural_i]),
+                    _cell_str(row[meaning_i]),
+                ))
+            sheets[ws.title] = nouns
+        return sheets
+    finally:
+        wb.close()
+
+
+class SheetRows(Sequence):
+    """One sheet's (word, article, plural, meaning) rows, decoded from the store on access."""
+
+    __slots__ = ("_buf", "_start", "_count", "_strings")
+
+    def __init__(self, buf, start, count, strings):
+        self._buf = buf
+        self._start = start  # byte offset of this sheet's first record
+        self._count = count
+        self._strings = strings
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        buf, base = self._buf, self._strings
+        w, wn, p, pn, m, mn, article = _NOUN.unpack_from(buf, self._start + index * _NOUN.size)
+        return (
+            buf[base + w:base + w + wn].decode("utf-8"),
+            _ARTICLE_NAMES[article],
+            buf[base + p:base + p + pn].decode("utf-8"),
+            buf[base + m:base + m + mn].decode("utf-8"),
+        )
+
+
+def _read_store(path):
+    """Map a compiled store read-only; returns (mtime, sha256, sheets) or None.
+
+    The mapping is shared through the page cache by every process that
+    opens the same file, so the vocabulary costs no per-worker copy.
+    """
+    try:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # missing or empty
+    if len(buf) < _HEADER.size:
+        return None
+    magic, fmt, _, mtime, digest, sheet_count, noun_count, strings = _HEADER.unpack_from(buf)
+    if magic != _MAGIC or fmt != CACHE_FORMAT:
+        return None
+    records = _HEADER.size + sheet_count * _SHEET.size
+    if records + noun_count * _NOUN.size != strings or strings > len(buf):
+        return None  # truncated
+    sheets = {}
+    for i in range(sheet_count):
+        name_off, name_len, first, count = _SHEET.unpack_from(buf, _HEADER.size + i * _SHEET.size)
+        name = buf[strings + name_off:strings + name_off + name_len].decode("utf-8")
+        sheets[name] = SheetRows(buf, records + first * _NOUN.size, count, strings)
+    return mtime, digest.hex(), sheets
+
+
+def _write_store(path, vocab):
+    strings = bytearray()
+    interned = {}
+
+    def ref(text):
+        # Identical strings (articles, "-", repeated words) are stored once
+        if text not in interned:
+            data = str(text).encode("utf-8")
+            interned[text] = (len(strings), len(data))
+            strings.extend(data)
+        return interned[text]
+
+    sheet_table = []
+    records = []
+    for name, rows in vocab.sheets.items():
+        sheet_table.append(_SHEET.pack(*ref(name), len(records), len(rows)))
+        for word, article, plural, meaning in rows:
+            records.append(_NOUN.pack(*ref(word), *ref(plural), *ref(meaning), article_code(article)))
+
+    header_size = _HEADER.size + _SHEET.size * len(sheet_table)
+    strings_offset = header_size + _NOUN.size * len(records)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(
+            _MAGIC, CACHE_FORMAT, 0, vocab.mtime, bytes.fromhex(vocab.digest),
+            len(sheet_table), len(records), strings_offset,
+        ))
+        f.writelines(sheet_table)
+        f.writelines(records)
+        f.write(strings)
+    # Processes that still map the old file keep reading it until they let go
+    os.replace(tmp, path)
+
+
+def build(excel_file=EXCEL_FILE, cache_file=CACHE_FILE):
+    """Return the vocabulary, from the compiled store when it is still valid.
+
+    The store is keyed by the workbook's mtime and SHA-256. A matching mtime
+    is trusted as-is; otherwise the workbook is hashed and only re-parsed
+    when its contents actually changed. Whenever it can be written, the
+    vocabulary is served from the memory-mapped store.
+    """
+    start = time.perf_counter()
+    mtime = os.stat(excel_file).st_mtime
+    stored = _read_store(cache_file)
+    if stored and stored[0] == mtime:
+        metrics.vocab_load_seconds.observe(time.perf_counter() - start, "cache")
+        return Vocabulary(*stored)
+
+    digest = _file_hash(excel_file)
+    if stored and stored[1] == digest:
+        vocab = Vocabulary(mtime, digest, stored[2])
+        source = "cache"
+    else:
+        vocab = Vocabulary(mtime, digest, _parse_workbook(excel_file))
+        source = "workbook"
+
+    vocab = _compile(cache_file, vocab)
+    metrics.vocab_load_seconds.observe(time.perf_counter() - start, source)
+    return vocab
+
+
+def _compile(cache_file, vocab):
+    """Write vocab to the store and return it served from the mapping."""
+    try:
+        _write_store(cache_file, vocab)
+        stored = _read_store(cache_file)
+        if stored:
+            vocab = Vocabulary(*stored)
+    except OSError:
+        pass  # read-only deployments still work, they just re-parse on boot
+    except struct.error:
+        log.warning("a cell is too long for the compiled store, serving %s uncompiled", vocab.version)
+    return vocab
+
+
+# Bumped by every import that changes a sheet (see importer.py)
+_DB_STAMP = "SELECT COALESCE(EXTRACT(EPOCH FROM MAX(updated_at))::float8, 0) FROM sheets"
+
+
+def build_from_database(cache_file=CACHE_FILE):
+    """Return the vocabulary imported into the sheets and nouns tables.
+
+    The newest sheets.updated_at plays the part of the workbook's mtime:
+    while it matches the compiled store, the nouns table is not read.
+    Otherwise the nouns are streamed through a server-side cursor.
+    """
+    from database import connection  # only needed with VOCAB_SOURCE=database
+
+    start = time.perf_counter()
+    with connection("load_vocab") as conn:
+        c = conn.cursor()
+        c.execute(_DB_STAMP)
+        mtime = c.fetchone()[0]
+        stored = _read_store(cache_file)
+        if stored and stored[0] == mtime:
+            metrics.vocab_load_seconds.observe(time.perf_counter() - start, "cache")
+            return Vocabulary(*stored)
+
+        rows = conn.cursor(name="load_vocab")
+        rows.itersize = DB_FETCH_SIZE
+        rows.execute("""
+            SELECT s.name, n.word, n.article, n.plural, n.meaning
+            FROM sheets s JOIN nouns n ON n.sheet_id = s.id
+            ORDER BY s.position, s.id, n.position
+        """)
+        h = hashlib.sha256()
+        sheets = {}
+        for name, *row in rows:
+            sheets.setdefault(name, []).append(tuple(row))
+            h.update("\x1f".join([name, *row]).encode("utf-8") + b"\x1e")
+        rows.close()
+
+    vocab = _compile(cache_file, Vocabulary(mtime, h.hexdigest(), sheets))
+    metrics.vocab_load_seconds.observe(time.perf_counter() - start, "database")
+    return vocab
+
+
+class WorkbookProvider:
+    """Vocabulary from the Excel workbook; its mtime is the change stamp."""
+
+    def __init__(self, excel_file=EXCEL_FILE, cache_file=CACHE_FILE):
+        self.excel_file = excel_file
+        self.cache_file = cache_file
+
+    def stamp(self):
+        return os.stat(self.excel_file).st_mtime
+
+    def load(self):
+        return build(self.excel_file, self.cache_file)
+
+    def __str__(self):
+        return self.excel_file
+
+
+class DatabaseProvider:
+    """Vocabulary from the sheets and nouns tables; the newest import is the change stamp."""
+
+    def __init__(self, cache_file=CACHE_FILE):
+        self.cache_file = cache_file
+
+    def stamp(self):
+        from database import connection
+
+        with connection("vocab_stamp") as conn:
+            c = conn.cursor()
+            c.execute(_DB_STAMP)
+            return c.fetchone()[0]
+
+    def load(self):
+        return build_from_database(self.cache_file)
+
+    def __str__(self):
+        return "the vocabulary tables"
+
+
+PROVIDERS = {"excel": WorkbookProvider, "database": DatabaseProvider}
+
+
+def make_provider(source=VOCAB_SOURCE):
+    try:
+        return PROVIDERS[source]()
+    except KeyError:
+        raise ValueError(f"VOCAB_SOURCE must be one of {', '.join(PROVIDERS)}, not {source!r}") from None
+
+
+class VocabularyRegistry:
+    """The current vocabulary, reloaded in the background when its source changes.
+
+    Requests only ever read ``current``, which a watcher thread replaces
+    with a freshly built Vocabulary in one assignment, so no request waits
+    on a parse. The last few versions stay reachable through snapshot(), so
+    a game keeps the data it started with. The provider's change stamp
+    must stay the same for one interval before it is reloaded, which skips
+    half-written saves; a source that fails to load is retried once its
+    stamp changes again.
+    """
+
+    def __init__(self, provider=None, interval=WATCH_INTERVAL, keep=KEEP_VERSIONS):
+        self.provider = provider if provider is not None else make_provider()
+        self.interval = interval
+        self.keep = keep
+        self.current = None
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._seen_mtime = None
+        self._failed_mtime = None
+
+    def get(self):
+        if self.current is None or self._pid != os.getpid():
+            with self._lock:
+                if self.current is None:
+                    self._install(self.provider.load())
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    if self.interval > 0:
+                        threading.Thread(
+                            target=self._watch, name="vocab-watcher", daemon=True
+                        ).start()
+        return self.current
+
+    def snapshot(self, version):
+        """The vocabulary with this version, or None if it is no longer held."""
+        with self._lock:
+            return self._snapshots.get(version)
+
+    def _install(self, vocab):
+        self._snapshots[vocab.version] = vocab
+        self._snapshots.move_to_end(vocab.version)
+        while len(self._snapshots) > self.keep:
+            self._snapshots.popitem(last=False)
+        self.current = vocab
+
+    def _watch(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                log.exception("vocabulary check failed")
+
+    def check(self):
+        """Reload the source if it changed and has been stable for one poll."""
+        mtime = self.provider.stamp()
+        current = self.current
+        if mtime == current.mtime or mtime == self._failed_mtime:
+            return False
+        if mtime != self._seen_mtime:
+            self._seen_mtime = mtime
+            return False
+        try:
+            vocab = self.provider.load()
+        except Exception:
+            self._failed_mtime = mtime
+            metrics.vocab_reloads_total.inc("failed")
+            log.exception("reloading %s failed, keeping version %s", self.provider, current.version)
+            return False
+        with self._lock:
+            if vocab.version == current.version:
+                vocab = current  # touched but unchanged: keep the warm noun cache
+                vocab.mtime = mtime
+            else:
+                self._install(vocab)
+        if vocab is current:
+            metrics.vocab_reloads_total.inc("unchanged")
+            return False
+        metrics.vocab_reloads_total.inc("reloaded")
+        log.info("vocabulary version %s -> %s", current.version, vocab.version)
+        return True
+
+
+_registry = VocabularyRegistry()
+
+
+def get_vocabulary():
+    """Return the current vocabulary; it is loaded on first use."""
+    return _registry.get()
+
+
+def snapshot(version):
+    """Return the vocabulary a game was started with, or None if it has been dropped."""
+    _registry.get()
+    return _registry.snapshot(version)
+
+
+def load():
+    """Load the configured source now, as workers would, and compile the store."""
+    return _registry.provider.load()
+
+
+def sheet_names():
+    return get_vocabulary().sheet_names
+
+
+def sheet_rows(sheet_name):
+    return get_vocabulary().sheets[sheet_name]
@@ -0,0 +1,250 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+_writers = weakref.WeakSet()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BatchWriter:
+    """Bounded in-memory queue flushed in batches by a background thread.
+
+    Every queued record is also appended to a per-process JSON-lines spill
+    file, which is rewritten after each successful flush to hold only what
+    is still pending. Spill files left behind by dead processes are picked
+    up on start, so queued records survive a crash. Delivery is
+    at-least-once: a crash between a flush committing and the spill file
+    being rewritten replays that batch.
+    """
+
+    def __init__(self, name, flush_fn, batch_size=50, interval=1.0,
+                 max_pending=10_000, spill_dir=None, fsync=False):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.spill_dir = spill_dir
+        self.fsync = fsync
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._spill = None
+        self._pid = None
+
+        self.submitted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        _writers.add(self)
+
+    # -- spill file -------------------------------------------------------
+
+    def _spill_path(self, pid):
+        return os.path.join(self.spill_dir, f"{self.name}-{pid}.jsonl")
+
+    def _write_spill(self, record):
+        self._spill.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._spill.flush()
+        if self.fsync:
+            os.fsync(self._spill.fileno())
+
+    def _rewrite_spill(self):
+        path = self._spill_path(self._pid)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in self._pending:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._spill.close()
+        os.replace(tmp, path)
+        self._spill = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _read_spill(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # torn final line from the crash
+
+    def _recover_spills(self):
+        own = self._spill_path(self._pid)
+        for path in glob.glob(os.path.join(self.spill_dir, f"{self.name}-*.jsonl")):
+            try:
+                pid = int(path.rsplit("-", 1)[1].split(".")[0])
+            except ValueError:
+                continue
+            if path == own or (pid != self._pid and _pid_alive(pid)):
+                continue
+            # Claim the file under our own PID first, so two workers never
+            # recover the same records; if we die before finishing, the
+            # claimed file is recovered like any other
+            claimed = os.path.join(self.spill_dir, f"{self.name}-claim{time.time_ns()}-{self._pid}.jsonl")
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # another worker got there first
+            try:
+                records = list(self._read_spill(claimed))
+            except OSError:
+                log.exception("%s: could not read spill file %s", self.name, claimed)
+                continue
+            for record in records:
+                self._pending.append(record)
+                self._write_spill(record)
+            os.remove(claimed)
+        if self._pending:
+            log.warning("%s: recovered %d spilled records", self.name, len(self._pending))
+
+    # -- lifecycle --------------------------------------------------------
+
+    def _ensure_started(self):
+        # Called with the lock held; (re)starts the worker in each process
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending.clear()
+        if self._spill:
+            self._spill.close()  # inherited from the parent process
+            self._spill = None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._spill_path(self._pid)
+            # A file under our own PID was left by a dead process that had
+            # it before us, typically before a container restart
+            if os.path.exists(path):
+                self._pending.extend(self._read_spill(path))
+            self._spill = open(path, "a", encoding="utf-8")
+            if self._pending:
+                self._rewrite_spill()  # drops a torn final line
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.name}-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+        if self.spill_dir:
+            # After the thread has started, so a failed recovery cannot leave
+            # a writer that queues records but never flushes them
+            self._recover_spills()
+
+    def start(self):
+        with self._cond:
+            self._ensure_started()
+
+    def submit(self, record):
+        """Queue a JSON-serialisable record; False if the queue is full."""
+        with self._cond:
+            self._ensure_started()
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending.append(record)
+            if self._spill:
+                self._write_spill(record)
+            self.submitted += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def _run(self):
+        backoff = False
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while not self._stopping and (backoff or len(self._pending) < self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+            # After a failed flush, wait a full interval before retrying
+            backoff = not self._flush_once()
+
+    def _flush_once(self):
+        with self._cond:
+            batch = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+        if not batch:
+            return True
+        try:
+            self.flush_fn(batch)
+        except Exception:
+            self.failures += 1
+            log.exception("%s: flushing %d records failed, will retry", self.name, len(batch))
+            return False
+        with self._cond:
+            for _ in batch:
+                self._pending.popleft()
+            self.flushed += len(batch)
+            self.batches += 1
+            if self._spill:
+                self._rewrite_spill()
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop the worker and drain the queue; anything left stays spilled."""
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            if not self._flush_once():
+                break
+        with self._cond:
+            if self._spill:
+                self._spill.close()
+                if not self._pending:
+                    os.remove(self._spill_path(self._pid))
+                self._spill = None
+            self._thread = None
+            self._pid = None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failures": self.failures,
+            }
+
+
+@metrics.REGISTRY.collector
+def _writer_metrics():
+    per_writer = {w.name: w.stats() for w in list(_writers)}
+    return [
+        (f"writebehind_{field}" + ("" if field == "pending" else "_total"),
+         "gauge" if field == "pending" else "counter",
+         f"Write-behind queue {field}.",
+         {(("writer", name),): s[field] for name, s in sorted(per_writer.items())})
+        for field in ("pending", "submitted", "rejected", "flushed", "batches", "failures")
+    ]